@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_version, invalidate
+
+USER_KEY = 'api:auth:user:{}:{}'
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def user_cache_key(user_id):
+    return USER_KEY.format(user_id, get_version(user_namespace(user_id)))
+
+
+def invalidate_user(user_id):
+    """Drop the cached copy of a user once the current transaction commits, see users.signals."""
+    invalidate(user_namespace(user_id))
+
+
+# Cached alongside the user's fields; what an authenticated request reads.
+PROFILE_FIELDS = ('wallet_balance', 'adoption_count')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt's JWTAuthentication, loading the user from the cache for up
+    to AUTH_USER_CACHE_TIMEOUT seconds instead of the database, so a warm
+    request runs no authentication query at all.
+
+    The entry is keyed on the user's id and cache version. Saving or
+    deleting a user bumps that version, and so does a QuerySet.update() of
+    users (see users.managers.UserQuerySet), so deactivating a user or
+    changing a password applies from the next request. A write that skips
+    both, such as raw SQL, is picked up once the entry expires. With
+    AUTH_USER_CACHE_PROFILE the user also carries its `wallet_balance` and
+    `adoption_count` from the same query; ledger entries and adoptions then
+    invalidate it too.
+
+    Only the user's other fields and a digest of its password hash are
+    cached, never the hash itself. The revoke claim is checked against the
+    digest; `password` is left deferred and loaded by the rare code path
+    that reads it, such as set_password.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = user_cache_key(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.load_entry(user_id)
+            cache.set(key, entry, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not entry['fields']['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry['password_digest']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        fields = entry['fields']
+        user = self.user_model.from_db(self.user_model.objects.db, list(fields), list(fields.values()))
+        for name, value in entry['profile'].items():
+            setattr(user, name, value)
+        return user
+
+    def load_entry(self, user_id):
+        users = self.user_model.objects
+        queryset = users.with_profile() if settings.AUTH_USER_CACHE_PROFILE else users.all()
+        try:
+            user = queryset.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        return {
+            'fields': {
+                field.attname: getattr(user, field.attname)
+                for field in self.user_model._meta.concrete_fields if field.name != 'password'
+            },
+            'profile': {name: getattr(user, name) for name in PROFILE_FIELDS if hasattr(user, name)},
+            'password_digest': get_md5_hash_password(user.password),
+        }
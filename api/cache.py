@@ -0,0 +1,141 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+VERSION_KEY = 'api:version:{}'
+MODIFIED_KEY = 'api:modified:{}'
+
+
+def _seed():
+    # Seeding from the clock means a version key lost to eviction never comes
+    # back with a number that older cache entries were stored under.
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        version = _seed()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_last_modified(namespace):
+    return cache.get(MODIFIED_KEY.format(namespace))
+
+
+def bump_version(*namespaces):
+    now = int(time.time())
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), None)
+        cache.set(MODIFIED_KEY.format(namespace), now, None)
+
+
+def invalidate(*namespaces):
+    """
+    Bump `namespaces` once the current transaction commits, so a reader
+    can never cache pre-commit data under the new version.
+    """
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def get_audience(request):
+    user = request.user
+    if user.is_staff:
+        return 'staff'
+    if user.is_authenticated:
+        return 'auth'
+    return 'anon'
+
+
+def response_cache_key(namespace, request):
+    # Sorting the query string lets `?a=1&b=2` and `?b=2&a=1` share an entry.
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    path = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'api:response:{namespace}:{get_version(namespace)}:{get_audience(request)}:{path}'
+
+
+def response_etag(namespace, request):
+    return quote_etag(hashlib.sha1(response_cache_key(namespace, request).encode()).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    Serve `list` from the cache.
+
+    Entries are keyed on the namespace version, the caller's audience
+    (anonymous, authenticated or staff see different querysets and fields)
+    and the full path including the query string. Writes bump the namespace
+    version instead of deleting keys, see pets.signals.
+
+    `retrieve` is not cached: a hit would skip get_object() and with it the
+    object-level permission checks.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, timeout=None, **kwargs):
+        key = response_cache_key(self.cache_namespace, request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT if timeout is None else timeout)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer `If-None-Match` and `If-Modified-Since` on `list` and `retrieve`
+    from the namespace version alone, before the queryset is built or the
+    serializer runs.
+
+    The strong ETag covers the same version, audience and path as the
+    response cache key, so it changes whenever a write to the namespace
+    commits. The namespace's modification time says nothing about the
+    audience, so Last-Modified is only sent, and If-Modified-Since only
+    honoured, for anonymous requests; a client that signs in never gets a
+    304 for what it saw signed out. Responses vary on Authorization.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = response_etag(self.cache_namespace, request)
+        last_modified = None
+        if get_audience(request) == 'anon':
+            last_modified = get_last_modified(self.cache_namespace)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Authorization'])
+        return response
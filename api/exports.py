@@ -0,0 +1,57 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_FORMAT_PARAM = 'export_format'
+
+
+class Echo:
+    """A file-like object whose `write` hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def get_export_format(request):
+    fmt = request.query_params.get(EXPORT_FORMAT_PARAM, 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ValidationError({EXPORT_FORMAT_PARAM: [f'Must be one of {", ".join(EXPORT_FORMATS)}.']})
+    return fmt
+
+
+def export_response(queryset, columns, filename, fmt='csv'):
+    """
+    Stream `queryset` as CSV or NDJSON.
+
+    `columns` is a sequence of `(header, lookup)` pairs. Rows are read with
+    `values_list(...).iterator()`, which uses a server-side cursor on
+    PostgreSQL, so only EXPORT_CHUNK_SIZE rows are held in memory at once
+    and the joins behind the lookups happen in SQL.
+    """
+    header = [name for name, _ in columns]
+    rows = queryset.values_list(*(lookup for _, lookup in columns)).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    lines = csv_lines(header, rows) if fmt == 'csv' else ndjson_lines(header, rows)
+
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from drf_yasg import openapi
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .exceptions import Conflict, UnprocessableEntity
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+RESULT_KEY = 'api:idempotency:{}'
+LOCK_KEY = 'api:idempotency:lock:{}'
+POLL_INTERVAL = 0.05
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+    description="Repeats with the same key get the first response back instead of running again",
+)
+
+
+def idempotency_cache_key(request, key):
+    # Keys are only unique per client, so scope them to the user and route.
+    return hashlib.sha256(f'{request.user.pk}:{request.method}:{request.path}:{key}'.encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    # Hash the parsed data rather than the raw body, whose multipart
+    # boundary changes on every retry.
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {name: values[0] if len(values) == 1 else values for name, values in data.lists()}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay(stored, fingerprint):
+    # Results stored before fingerprints were recorded have none to compare.
+    if stored.get('fingerprint', fingerprint) != fingerprint:
+        raise UnprocessableEntity(f"This {IDEMPOTENCY_HEADER} was already used with a different request body")
+    response = Response(stored['data'], status=stored['status'], headers=stored['headers'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """
+    Honour an `Idempotency-Key` header on a view method.
+
+    The first successful response for a key is stored for
+    IDEMPOTENCY_KEY_TTL seconds and replayed for any repeat without running
+    the view again, as long as its body is the same; reusing a key with a
+    different body is answered with 422. A repeat that arrives while the
+    first is still running waits for it on a cache lock instead of racing
+    it. Failed requests
+    are not stored, so the client can fix and resend them under the same
+    key. The lock and results live in the default cache, which must be
+    shared by every worker process for this to hold across them.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return handler(self, request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            raise ValidationError({IDEMPOTENCY_HEADER: ['Must be between 1 and 255 characters.']})
+
+        digest = idempotency_cache_key(request, key)
+        result_key, lock_key = RESULT_KEY.format(digest), LOCK_KEY.format(digest)
+        fingerprint = request_fingerprint(request)
+        # Identifies this holder, so a request whose lock expired while it
+        # ran never releases the lock a later request has since taken.
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        while True:
+            stored = cache.get(result_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+            if cache.add(lock_key, token, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            if time.monotonic() >= deadline:
+                raise Conflict(f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            # The previous holder may have stored its result between our
+            # read and taking the lock.
+            stored = cache.get(result_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code < 400:
+                headers = {name: response[name] for name in ('Location',) if response.has_header(name)}
+                cache.set(
+                    result_key,
+                    {
+                        'status': response.status_code, 'data': response.data,
+                        'headers': headers, 'fingerprint': fingerprint,
+                    },
+                    settings.IDEMPOTENCY_KEY_TTL,
+                )
+            return response
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+    return wrapper
@@ -0,0 +1,154 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, which would move the
+    # boundary past rows that share the boundary row's millisecond.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on `(ordering field, tiebreak)`.
+
+    DRF's CursorPagination falls back to an offset when the ordering field
+    has duplicates (price, age, ...). Here the cursor carries the full key of
+    the boundary row, so every page is a single range scan of
+    `page_size + 1` rows no matter how deep the client scrolls.
+    Only the first ordering field is used; the tiebreak follows its direction.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+    tiebreak = 'id'
+    rank_field = 'search_rank'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.field = self.get_ordering(request, queryset, view)[0]
+        name = self.field.lstrip('-')
+        self.keys = (name,) if name == self.tiebreak else (name, self.tiebreak)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        # Walking backwards to the previous page flips the scan direction.
+        descending = self.field.startswith('-') != reverse
+
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(*[prefix + key for key in self.keys])
+        if cursor:
+            position = self.parse_position(queryset, cursor['p'])
+            queryset = queryset.filter(self.get_keyset_filter(position, descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, request, queryset, view):
+        # Full-text results come back best match first unless the client
+        # asked for an explicit ordering.
+        if self.rank_field in queryset.query.annotations and api_settings.ORDERING_PARAM not in request.query_params:
+            return ('-' + self.rank_field,)
+        return super().get_ordering(request, queryset, view)
+
+    def parse_position(self, queryset, position):
+        """
+        Convert the cursor's JSON values back to the ordering fields' types,
+        rejecting a tampered cursor the way a malformed one is.
+        """
+        values = []
+        for key, value in zip(self.keys, position):
+            try:
+                field = queryset.model._meta.get_field(key)
+            except FieldDoesNotExist:
+                # Annotations such as the search rank are plain numbers.
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            else:
+                try:
+                    value = field.to_python(value)
+                except (ValidationError, TypeError, ValueError):
+                    valid = False
+                else:
+                    valid = value is not None
+            if not valid:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def get_keyset_filter(self, position, descending):
+        """
+        Rows strictly after `position` in scan order, i.e. `(a, b) > (x, y)`
+        spelled out as `a >= x AND (a > x OR (a = x AND b > y))` so the
+        leading column still bounds the index range.
+        """
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        equal = {}
+        for key, value in zip(self.keys, position):
+            condition |= Q(**equal, **{f'{key}__{lookup}': value})
+            equal[key] = value
+        first = self.keys[0]
+        return Q(**{f'{first}__{lookup}e': position[0]}) & condition
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor({'p': self.get_position(self.page[-1]), 'r': 0})
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor({'p': self.get_position(self.page[0]), 'r': 1})
+
+    def get_position(self, instance):
+        return [getattr(instance, key) for key in self.keys]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse, ordering = cursor['p'], cursor['r'], cursor['o']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # A cursor is only meaningful for the ordering it was issued for.
+        if ordering != self.field or not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+
+        return {'p': position, 'r': reverse}
+
+    def encode_cursor(self, cursor):
+        payload = json.dumps(dict(cursor, o=self.field), cls=CursorEncoder, separators=(',', ':'))
+        encoded = urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
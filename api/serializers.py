@@ -0,0 +1,45 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_field_list(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for read requests.
+
+    `?fields=a,b` renders only the listed fields. Fields named in
+    `Meta.expandable_fields` (nested or derived data) are rendered when
+    listed in `?fields=` or `?expand=`; without either parameter the ones in
+    `Meta.default_expand` are, and `?expand=` with no value turns them all
+    off. Only the top-level serializer of a request is affected.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    @classmethod
+    def wants_field(cls, request, name):
+        if request is None or request.method not in SAFE_METHODS:
+            return True
+
+        fields = parse_field_list(request, cls.fields_query_param)
+        expand = parse_field_list(request, cls.expand_query_param)
+
+        if name not in getattr(cls.Meta, 'expandable_fields', ()):
+            return fields is None or name in fields
+        if fields is not None and name in fields:
+            return True
+        if expand is None:
+            return fields is None and name in getattr(cls.Meta, 'default_expand', ())
+        return name in expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or self.root not in (self, self.parent):
+            return fields
+        return {name: field for name, field in fields.items() if self.wants_field(request, name)}
@@ -1,3 +1,74 @@
+import json
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from pets.models import Category, Pet
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages of the pet list, walked both ways over duplicate ordering values."""
+
+    prices = [10, 30, 10, 20, 10, 30, 20]
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pets = [
+            Pet.objects.create(
+                name=f'Pet {i}', category=category, breed='Beagle', age=1, description='Friendly', price=price,
+            )
+            for i, price in enumerate(cls.prices)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([pet['id'] for pet in response.data['results']])
+            url = response.data[link]
+        self.response = response
+        return pages
+
+    def test_pages_break_ties_on_id(self):
+        expected = [pet.id for pet in sorted(self.pets, key=lambda pet: (pet.price, pet.id))]
+        pages = self.walk('/api/pets/?ordering=price&page_size=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        pages = self.walk('/api/pets/?ordering=-price&page_size=2')
+        self.assertEqual(sum(pages, []), expected[::-1])
+
+    def test_previous_links_walk_back(self):
+        pages = self.walk('/api/pets/?ordering=price&page_size=3')
+        self.assertIsNotNone(self.response.data['previous'])
+
+        back = self.walk(self.response.data['previous'], link='previous')
+        self.assertEqual(back, pages[-2::-1])
+        self.assertIsNotNone(self.response.data['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        def cursor(payload):
+            encoded = urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            return self.client.get('/api/pets/', {'cursor': encoded, 'ordering': payload.get('o', 'id')})
+
+        self.assertEqual(self.client.get('/api/pets/', {'cursor': 'not-a-cursor'}).status_code, 404)
+        for payload in (
+            {'p': ['abc'], 'r': False, 'o': 'id'},
+            {'p': [None], 'r': False, 'o': 'id'},
+            {'p': [[1]], 'r': False, 'o': 'id'},
+            {'p': [1], 'r': False, 'o': 'price'},
+            {'p': ['ten', 1], 'r': False, 'o': 'price'},
+            {'p': [1], 'r': False},
+        ):
+            self.assertEqual(cursor(payload).status_code, 404, payload)
 
-# Create your tests here.
+        response = cursor({'p': [str(Decimal('10.00')), self.pets[0].id], 'r': False, 'o': 'price'})
+        self.assertEqual(response.status_code, 200)
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework_nested import routers
 from pets.views import PetViewSet, CategoryViewSet, PetImageViewSet, ReviewViewSet
 from order.views import AdoptViewSet, AdoptPetViewSet
-from users.views import WalletViewSet, WalletAdminViewSet
+from users.views import UserViewSet, WalletViewSet, WalletAdminViewSet
 # from order.views import AdoptViewSet
 
 
@@ -12,6 +12,8 @@ router.register('categories', CategoryViewSet)
 router.register('adoptions', AdoptViewSet, basename='adoptions')
 router.register('wallet', WalletViewSet, basename='wallet')          
 router.register('admin/wallet', WalletAdminViewSet, basename='admin-wallet') 
+# Ahead of djoser.urls, which registers its own UserViewSet at the same path.
+router.register('auth/users', UserViewSet, basename='user')
 
 
 pet_router = routers.NestedDefaultRouter(
@@ -1,23 +1,39 @@
 from django.contrib import admin
+from api.admin import LargeTableAdminMixin
+from api.exports import export_response
+from .exports import ADOPTION_EXPORT_COLUMNS, adoption_export_queryset
 from .models import Adopt, AdoptPet
 
 
 class AdoptPetInline(admin.TabularInline):
     model = AdoptPet
     extra = 1
+    # A select would list every pet on each row.
+    raw_id_fields = ('pet',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('pet')
 
 
 @admin.register(Adopt)
-class AdoptAdmin(admin.ModelAdmin):
+class AdoptAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('created_at',)
     search_fields = ('user__email', 'id')
     ordering = ('-created_at',)
     readonly_fields = ('id', 'created_at')
     inlines = [AdoptPetInline]
+    actions = ['export_csv']
+
+    @admin.action(description="Export selected adoptions as CSV")
+    def export_csv(self, request, queryset):
+        return export_response(adoption_export_queryset(queryset), ADOPTION_EXPORT_COLUMNS, 'adoptions')
 
 
 @admin.register(AdoptPet)
-class AdoptPetAdmin(admin.ModelAdmin):
+class AdoptPetAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'adopt', 'pet')
+    list_select_related = ('adopt__user', 'pet')
+    raw_id_fields = ('adopt', 'pet')
     search_fields = ('adopt__id', 'pet__name')
@@ -0,0 +1,105 @@
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+
+from api.cache import invalidate
+from api.exceptions import Conflict
+from pets.aggregates import apply_category_deltas, category_counts
+from pets.holds import holdable_by
+from pets.models import Pet
+from users.ledger import debit
+from .models import Adopt, AdoptPet
+
+
+def checkout_pets(user, adopt_id, pet_ids, field='pet_ids'):
+    """
+    Adopt the pets in `pet_ids` into `adopt_id`, paid from `user`'s wallet.
+
+    The pets are read with one query. Then, in one transaction, they are
+    claimed with one conditional UPDATE, the wallet ledger is debited once
+    for the total, and the AdoptPet rows are bulk inserted with the prices
+    paid. Of several concurrent checkouts for the same pets only the first
+    claim succeeds, and debits of one wallet queue on its row (see
+    users.ledger.debit).
+    A pet another user holds (see pets.holds) raises Conflict (409) before
+    any wallet work. Losing a pet to another checkout or hold raises
+    Conflict too, and the whole checkout is rolled back. Validation errors are reported under `field`.
+    An adoption that is not `user`'s own raises NotFound (404).
+    """
+    try:
+        owned = Adopt.objects.filter(pk=adopt_id, user=user).exists()
+    except DjangoValidationError:
+        owned = False
+    if not owned:
+        raise NotFound("Adoption not found")
+
+    pet_ids = list(dict.fromkeys(pet_ids))
+    pets = {
+        pet['id']: pet
+        for pet in Pet.objects.filter(pk__in=pet_ids).values(
+            'id', 'name', 'price', 'category_id', 'availability', 'is_adopted', 'held_by_id', 'held_until',
+        )
+    }
+    missing = [pet_id for pet_id in pet_ids if pet_id not in pets]
+    if missing:
+        label = "Pet does not exist" if len(pet_ids) == 1 else f"Pets do not exist: {', '.join(map(str, missing))}"
+        raise serializers.ValidationError({field: [label]})
+
+    adopted = [pet['name'] for pet in pets.values() if pet['is_adopted']]
+    if adopted:
+        raise Conflict(f"Already adopted: {', '.join(adopted)}")
+
+    now = timezone.now()
+    held = [
+        pet['name'] for pet in pets.values()
+        if pet['held_by_id'] not in (None, user.pk) and pet['held_until'] > now
+    ]
+    if held:
+        raise Conflict(f"Held by another user: {', '.join(held)}")
+
+    total = sum(pet['price'] for pet in pets.values())
+    with transaction.atomic():
+        # Matching on the values read above also catches a price or
+        # category edit racing this checkout, and the hold check a hold
+        # taken since.
+        unchanged = reduce(or_, (
+            Q(pk=pet['id'], price=pet['price'], category_id=pet['category_id'], availability=pet['availability'])
+            for pet in pets.values()
+        ))
+        claimed = (
+            Pet.objects.filter(unchanged, holdable_by(user, now), is_adopted=False)
+            .update(is_adopted=True, held_by=None, held_until=None)
+        )
+        if claimed != len(pets):
+            raise Conflict(
+                f"Pet '{pets[pet_ids[0]]['name']}' is no longer available" if len(pets) == 1
+                else "Some of these pets are no longer available"
+            )
+
+        if not debit(user, total, adopt_id=adopt_id):
+            raise serializers.ValidationError({field: ["Insufficient wallet balance"]})
+
+        adopt_pets = AdoptPet.objects.bulk_create([
+            AdoptPet(adopt_id=adopt_id, pet_id=pet_id, price=pets[pet_id]['price']) for pet_id in pet_ids
+        ])
+
+        # Queryset updates skip Pet.save(), so keep its bookkeeping here.
+        deltas = defaultdict(Counter)
+        for pet in pets.values():
+            deltas[pet['category_id']].subtract(category_counts(False, pet['availability']))
+            deltas[pet['category_id']].update(category_counts(True, pet['availability']))
+        apply_category_deltas(deltas)
+        invalidate('pets', 'categories')
+    return adopt_pets
+
+
+def checkout_pet(user, adopt_id, pet_id):
+    """Adopt a single pet, see checkout_pets()."""
+    return checkout_pets(user, adopt_id, [pet_id], field='pet_id')[0]
@@ -0,0 +1,19 @@
+from .models import AdoptPet
+
+# One row per adopted pet, as `(header, lookup)` pairs for api.exports.
+ADOPTION_EXPORT_COLUMNS = (
+    ('adoption_id', 'adopt_id'),
+    ('adopted_at', 'adopt__created_at'),
+    ('user_email', 'adopt__user__email'),
+    ('pet_id', 'pet_id'),
+    ('pet_name', 'pet__name'),
+    ('category', 'pet__category__name'),
+    ('price', 'price'),
+)
+
+
+def adoption_export_queryset(adoptions=None):
+    queryset = AdoptPet.objects.all()
+    if adoptions is not None:
+        queryset = queryset.filter(adopt__in=adoptions)
+    return queryset.order_by('adopt__created_at', 'adopt_id', 'id')
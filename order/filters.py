@@ -0,0 +1,13 @@
+from django_filters.rest_framework import FilterSet, NumberFilter
+from order.models import Adopt
+
+class AdoptFilter(FilterSet):
+    # A plain number, so filtering does not look the user up first.
+    user_id = NumberFilter(field_name='user_id')
+
+    class Meta:
+        model = Adopt
+        fields = {
+            'user__email': ['exact'],
+            'created_at': ['gte', 'lte'],
+        }
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from order.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Refresh the daily adoption rollups for the days touched since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild the rollups of every day")
+
+    def handle(self, *args, **options):
+        span = refresh_rollups(full=options['full'])
+        if span is None:
+            self.stdout.write(self.style.SUCCESS("No adoptions to roll up"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Refreshed rollups from {span[0]} to {span[1]}"))
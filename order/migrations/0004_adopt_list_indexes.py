@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_alter_adoptpet_unique_together_remove_adopt_status_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adopt',
+            index=models.Index(fields=['created_at', 'id'], name='adopt_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adopt',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='adopt_user_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:16
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_adopted_pets(apps, schema_editor):
+    # Earlier checkouts are dated by their adoption, the closest record there is.
+    Adopt = apps.get_model('order', 'Adopt')
+    AdoptPet = apps.get_model('order', 'AdoptPet')
+    AdoptPet.objects.filter(created_at=None).update(
+        created_at=Subquery(Adopt.objects.filter(pk=OuterRef('adopt_id')).values('created_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_adopt_list_indexes'),
+        ('pets', '0014_pet_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAdoptionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('adoptions', models.PositiveIntegerField(default=0)),
+                ('pets_adopted', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('timed_pets', models.PositiveIntegerField(default=0)),
+                ('time_to_adoption', models.DurationField(default=datetime.timedelta)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('pets_adopted', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'ordering': ['day', 'category'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='adoptpet',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.RunPython(date_adopted_pets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='adoptpet',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='adoptpet',
+            index=models.Index(fields=['created_at'], name='adoptpet_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailycategorystats',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pets.category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailycategorystats',
+            unique_together={('day', 'category')},
+        ),
+    ]
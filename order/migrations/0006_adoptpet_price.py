@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:14
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def price_adopted_pets(apps, schema_editor):
+    # Earlier checkouts did not record what was paid; the pet's current
+    # price is the closest record there is.
+    AdoptPet = apps.get_model('order', 'AdoptPet')
+    Pet = apps.get_model('pets', 'Pet')
+    AdoptPet.objects.update(price=Subquery(Pet.objects.filter(pk=OuterRef('pet_id')).values('price')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_adoption_rollups'),
+        ('pets', '0014_pet_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adoptpet',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(price_adopted_pets, migrations.RunPython.noop),
+    ]
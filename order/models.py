@@ -1,13 +1,21 @@
+from datetime import timedelta
 from django.db import models
 from uuid import uuid4
 from users.models import User
-from pets.models import Pet
+from pets.models import Category, Pet
 
 class Adopt(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='adoptions')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of the adoption list, all users or one user's.
+            models.Index(fields=['created_at', 'id'], name='adopt_created_id_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='adopt_user_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.email} adoption {self.id}"
 
@@ -15,6 +23,51 @@ class Adopt(models.Model):
 class AdoptPet(models.Model):
     adopt = models.ForeignKey(Adopt, on_delete=models.CASCADE, related_name='adoptpets')
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE)
+    # When the pet was checked out, which can be long after its Adopt was created.
+    created_at = models.DateTimeField(auto_now_add=True)
+    # What the pet cost at checkout; the pet's own price may change later.
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='adoptpet_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.pet.name} in adoption {self.adopt.id}"
+        return f"{self.pet.name} in adoption {self.adopt_id}"
+
+
+class DailyAdoptionStats(models.Model):
+    """
+    Adoption totals for one day, maintained by order.rollups. Pets count
+    on the day they were checked out, adoptions on the day they were
+    created.
+    """
+    day = models.DateField(unique=True)
+    adoptions = models.PositiveIntegerField(default=0)
+    pets_adopted = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Listing to checkout, summed over the pets whose listing time is known.
+    timed_pets = models.PositiveIntegerField(default=0)
+    time_to_adoption = models.DurationField(default=timedelta)
+
+    class Meta:
+        ordering = ['day']
+
+
+class DailyCategoryStats(models.Model):
+    """Pets adopted and revenue for one category on one day, see order.rollups."""
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    pets_adopted = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['day', 'category']
+        unique_together = ('day', 'category')
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has been refreshed, by the timestamps of its source rows."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DateTimeField()
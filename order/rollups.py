@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Adopt, AdoptPet, DailyAdoptionStats, DailyCategoryStats, RollupWatermark
+
+WATERMARK = 'adoption_rollups'
+# Rows are timestamped before their transaction commits, so one still in
+# flight at the last refresh can commit just below the watermark. Each
+# refresh starts this far behind it to pick such rows up.
+COMMIT_LAG = timedelta(minutes=5)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def refresh_days(first, last):
+    """
+    Recompute the rollups of the days from `first` to `last` inclusive.
+
+    Each source table is read once, through its created_at index, for just
+    that span; the days' rollup rows are then replaced in one transaction.
+    """
+    start, end = day_start(first), day_start(last + timedelta(days=1))
+    adoptions = (
+        Adopt.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    adopted = (
+        AdoptPet.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'))
+        .order_by()
+    )
+    waited = ExpressionWrapper(F('created_at') - F('pet__created_at'), output_field=DurationField())
+    pets = adopted.values('day').annotate(
+        pets_adopted=Count('id'),
+        revenue=Sum('price'),
+        timed_pets=Count('pet__created_at'),
+        time_to_adoption=Sum(waited),
+    )
+    categories = adopted.values('day', 'pet__category_id').annotate(pets_adopted=Count('id'), revenue=Sum('price'))
+
+    stats = {row['day']: DailyAdoptionStats(day=row['day'], adoptions=row['count']) for row in adoptions}
+    for row in pets:
+        day = stats.setdefault(row['day'], DailyAdoptionStats(day=row['day']))
+        day.pets_adopted = row['pets_adopted']
+        day.revenue = row['revenue'] or 0
+        day.timed_pets = row['timed_pets']
+        day.time_to_adoption = row['time_to_adoption'] or timedelta()
+
+    with transaction.atomic():
+        DailyAdoptionStats.objects.filter(day__range=(first, last)).delete()
+        DailyCategoryStats.objects.filter(day__range=(first, last)).delete()
+        DailyAdoptionStats.objects.bulk_create(stats.values())
+        DailyCategoryStats.objects.bulk_create([
+            DailyCategoryStats(
+                day=row['day'], category_id=row['pet__category_id'],
+                pets_adopted=row['pets_adopted'], revenue=row['revenue'] or 0,
+            )
+            for row in categories
+        ])
+
+
+def refresh_rollups(full=False):
+    """
+    Bring the rollups up to date and return the span of days refreshed,
+    or None if there was nothing to do.
+
+    Adoptions and checkouts are only ever stamped with the current time, so
+    the days touched since the last run are those from the watermark on.
+    Deleting an adoption touches no timestamp; a `full` refresh rebuilds
+    every day and picks that up.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Also keeps two refreshes from interleaving.
+        mark = RollupWatermark.objects.select_for_update().filter(name=WATERMARK).first()
+        if full or mark is None:
+            DailyAdoptionStats.objects.all().delete()
+            DailyCategoryStats.objects.all().delete()
+            since = Adopt.objects.aggregate(since=Min('created_at'))['since']
+        else:
+            since = mark.value - COMMIT_LAG
+
+        span = None
+        if since is not None:
+            span = (timezone.localdate(since), timezone.localdate(now))
+            refresh_days(*span)
+        RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': now})
+    return span
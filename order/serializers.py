@@ -1,7 +1,11 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Adopt, AdoptPet
+from .checkout import checkout_pet
+from .models import Adopt, AdoptPet, DailyAdoptionStats
 from pets.models import Pet
-from pets.serializers import PetSerializer
+from api.serializers import DynamicFieldsMixin
 
 class SimplePetSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -20,34 +24,17 @@ class AdoptPetSerializer(serializers.ModelSerializer):
         model = AdoptPet
         fields = ['id', 'pet_id', 'pet']
 
-    def validate_pet_id(self, value):
-        try:
-            pet = Pet.objects.get(pk=value)
-        except Pet.DoesNotExist:
-            raise serializers.ValidationError("Pet does not exist")
-        if pet.is_adopted:
-            raise serializers.ValidationError(f"Pet '{pet.name}' is already adopted")
-        user = self.context['request'].user
-        if user.wallet.balance < pet.price:
-            raise serializers.ValidationError("Insufficient wallet balance")
-        return value
-
     def create(self, validated_data):
-        adopt_id = self.context['adopt_id']
-        pet_id = validated_data['pet_id']
-        pet = Pet.objects.get(pk=pet_id)
-        user = self.context['request'].user
+        return checkout_pet(self.context['request'].user, self.context['adopt_id'], validated_data['pet_id'])
 
-        user.wallet.balance -= pet.price
-        user.wallet.save()
-        pet.is_adopted = True
-        pet.save()
 
-        adopt_pet = AdoptPet.objects.create(adopt_id=adopt_id, pet=pet)
-        return adopt_pet
+class AdoptPetBatchSerializer(serializers.Serializer):
+    pet_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.CHECKOUT_MAX_PETS,
+    )
 
 
-class AdoptSerializer(serializers.ModelSerializer):
+class AdoptSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     adoptpets = AdoptPetSerializer(many=True, read_only=True)
     user_balance = serializers.DecimalField(source='user.wallet.balance', max_digits=10, decimal_places=2, read_only=True)
 
@@ -55,6 +42,8 @@ class AdoptSerializer(serializers.ModelSerializer):
         model = Adopt
         fields = ['id','created_at', 'user_balance', 'adoptpets']
         read_only_fields = ['id', 'created_at']
+        expandable_fields = ['adoptpets']
+        default_expand = ['adoptpets']
 
     def validate(self, attrs):
         user = self.context['request'].user
@@ -62,4 +51,32 @@ class AdoptSerializer(serializers.ModelSerializer):
         if Adopt.objects.filter(user=user).exists():
             raise serializers.ValidationError("You already have an active adoption.")
 
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+def average_days(total, count):
+    return round(total.total_seconds() / count / 86400, 2) if count else None
+
+
+class AdoptionStatsQuerySerializer(serializers.Serializer):
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('until', timezone.localdate())
+        attrs.setdefault('since', attrs['until'] - timedelta(days=29))
+        if attrs['since'] > attrs['until']:
+            raise serializers.ValidationError({'since': ["Must not be after until."]})
+        return attrs
+
+
+class DailyAdoptionStatsSerializer(serializers.ModelSerializer):
+    avg_days_to_adoption = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DailyAdoptionStats
+        fields = ['day', 'adoptions', 'pets_adopted', 'revenue', 'avg_days_to_adoption']
+        read_only_fields = fields
+
+    def get_avg_days_to_adoption(self, obj):
+        return average_days(obj.time_to_adoption, obj.timed_pets)
@@ -1,3 +1,423 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.admin import EstimatedCountPaginator
+from pets.models import Category, Pet
+from users.ledger import credit
+from users.models import User, Wallet, WalletEntry
+from .checkout import checkout_pets
+from .exports import ADOPTION_EXPORT_COLUMNS
+from .models import Adopt, AdoptPet, DailyAdoptionStats
+from .rollups import refresh_rollups
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs row-level concurrency from a real database server')
+class CheckoutContentionTests(TransactionTestCase):
+    """
+    Concurrent checkouts run on their own threads and connections. However
+    they interleave, a pet is sold once and no wallet is overdrawn.
+    """
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Dog')
+
+    def create_pet(self, name, price):
+        return Pet.objects.create(
+            name=name, category=self.category, breed='Beagle', age=2, description='Friendly', price=price,
+        )
+
+    def create_buyer(self, email, balance):
+        user = User.objects.create_user(email=email, password='secret')
+        credit(user.wallet.pk, balance)
+        return user, Adopt.objects.create(user=user)
+
+    def race(self, attempts):
+        barrier = threading.Barrier(len(attempts))
+        statuses = [None] * len(attempts)
+
+        def checkout(index, user, adopt, pet):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post(f'/api/adoptions/{adopt.id}/pets/', {'pet_id': pet.id})
+                statuses[index] = response.status_code
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout, args=(index, *attempt)) for index, attempt in enumerate(attempts)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return statuses
+
+    def test_pet_is_sold_once(self):
+        pet = self.create_pet('Rex', Decimal('100.00'))
+        buyers = [self.create_buyer(f'buyer{i}@example.com', Decimal('500.00')) for i in range(self.threads)]
+
+        statuses = self.race([(user, adopt, pet) for user, adopt in buyers])
+
+        self.assertEqual(sorted(statuses), [201] + [409] * (self.threads - 1))
+        self.assertEqual(AdoptPet.objects.filter(pet=pet).count(), 1)
+        balances = sorted(Wallet.objects.filter(user__in=[user for user, _ in buyers]).values_list('current_balance', flat=True))
+        self.assertEqual(balances, [Decimal('400.00')] + [Decimal('500.00')] * (self.threads - 1))
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.pet_count, self.category.available_pet_count), (1, 0))
+
+    def test_wallet_is_not_overdrawn(self):
+        user, adopt = self.create_buyer('family@example.com', Decimal('300.00'))
+        pets = [self.create_pet(f'Pup {i}', Decimal('100.00')) for i in range(self.threads)]
+
+        statuses = self.race([(user, adopt, pet) for pet in pets])
+
+        self.assertEqual(statuses.count(201), 3)
+        self.assertEqual(statuses.count(400), self.threads - 3)
+        self.assertEqual(Wallet.objects.get(user=user).balance, Decimal('0.00'))
+        self.assertEqual(AdoptPet.objects.filter(adopt=adopt).count(), 3)
+        self.assertEqual(Pet.objects.filter(is_adopted=True).count(), 3)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Dog')
+        self.pets = [
+            Pet.objects.create(
+                name=f'Pup {i}', category=self.category, breed='Beagle', age=1, description='Friendly',
+                price=Decimal('40.00'),
+            )
+            for i in range(3)
+        ]
+        self.user, self.adopt = self.create_buyer('buyer@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_buyer(self, email, balance=Decimal('100.00')):
+        user = User.objects.create_user(email=email, password='secret')
+        credit(user.wallet.pk, balance)
+        return user, Adopt.objects.create(user=user)
+
+    def checkout(self, adopt_id, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/adoptions/{adopt_id}/pets/', data or {'pet_id': self.pets[0].id})
+
+    def test_only_own_adoptions_take_pets(self):
+        _, other_adopt = self.create_buyer('other@example.com')
+        for adopt_id in (other_adopt.pk, '00000000-0000-0000-0000-000000000000', 'abc'):
+            self.assertEqual(self.checkout(adopt_id).status_code, 404)
+            self.assertEqual(self.checkout(adopt_id, pet_ids=[self.pets[1].id]).status_code, 404)
+
+        self.assertFalse(AdoptPet.objects.exists())
+        self.assertFalse(Pet.objects.filter(is_adopted=True).exists())
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('100.00'))
+
+        self.assertEqual(self.checkout(self.adopt.pk).status_code, 201)
+        self.assertEqual(self.client.get(f'/api/adoptions/{other_adopt.pk}/pets/').data, [])
+
+    def test_batch_is_one_debit(self):
+        response = self.checkout(self.adopt.pk, pet_ids=[pet.id for pet in self.pets[:2]])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+
+        entries = WalletEntry.objects.filter(wallet__user=self.user, kind=WalletEntry.Kind.ADOPTION)
+        self.assertEqual(list(entries.values_list('amount', 'adopt_id')), [(Decimal('-80.00'), self.adopt.pk)])
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('20.00'))
+        self.assertEqual(AdoptPet.objects.filter(adopt=self.adopt).count(), 2)
+
+    def test_batch_is_all_or_nothing(self):
+        other, other_adopt = self.create_buyer('other@example.com')
+        checkout_pets(other, other_adopt.pk, [self.pets[1].id])
+
+        response = self.checkout(self.adopt.pk, pet_ids=[self.pets[0].id, self.pets[1].id])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(AdoptPet.objects.filter(adopt=self.adopt).exists())
+        self.assertFalse(Pet.objects.get(pk=self.pets[0].pk).is_adopted)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('100.00'))
+
+        # Failing after the pets were claimed, here on the debit, releases them.
+        with patch('order.checkout.debit', return_value=False):
+            response = self.checkout(self.adopt.pk, pet_ids=[self.pets[0].id, self.pets[2].id])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Pet.objects.filter(pk__in=[self.pets[0].pk, self.pets[2].pk], is_adopted=True).exists())
+        self.assertFalse(WalletEntry.objects.filter(wallet__user=self.user, kind=WalletEntry.Kind.ADOPTION).exists())
+
+    def test_batch_size_is_bounded(self):
+        with self.assertNumQueries(0):
+            response = self.checkout(self.adopt.pk, pet_ids=list(range(1, settings.CHECKOUT_MAX_PETS + 2)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pet_ids', response.data)
+
+
+class AdoptionListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Dog')
+        self.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def add_adoptions(self, count, created_at=None):
+        adopts = []
+        for i in range(count):
+            user = User.objects.create_user(email=f'family{User.objects.count()}@example.com', password='secret')
+            adopt = Adopt.objects.create(user=user)
+            pet = Pet.objects.create(name=f'Pup {i}', category=self.category, breed='Mixed', age=1, description='Friendly')
+            AdoptPet.objects.create(adopt=adopt, pet=pet)
+            if created_at is not None:
+                Adopt.objects.filter(pk=adopt.pk).update(created_at=created_at + timedelta(microseconds=100 * i))
+            adopts.append(adopt)
+        return adopts
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids.extend(adopt['id'] for adopt in response.data['results'])
+            url = response.data[link]
+        return ids
+
+    def test_list_is_a_fixed_number_of_queries(self):
+        # Adoptions joined with users, then one prefetch each for wallets and pets.
+        self.add_adoptions(2)
+        with self.assertNumQueries(3):
+            self.client.get('/api/adoptions/', {'created_at__gte': '2000-01-01'})
+        adopts = self.add_adoptions(5)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/adoptions/', {'created_at__gte': '2000-01-01', 'page_size': 4})
+        with self.assertNumQueries(3):
+            self.client.get(response.data['next'])
+        with self.assertNumQueries(3):
+            self.client.get('/api/adoptions/', {'user_id': adopts[0].user_id})
+
+    def test_fields_skip_unused_prefetches(self):
+        self.add_adoptions(2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/adoptions/', {'expand': ''})
+        self.assertFalse(any('adoptpets' in adopt for adopt in response.data['results']))
+
+        # No user_balance, so no wallet prefetch either.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/adoptions/', {'fields': 'id,adoptpets'})
+        self.assertEqual({tuple(adopt) for adopt in response.data['results']}, {('id', 'adoptpets')})
+
+    def test_pages_split_rows_within_one_millisecond(self):
+        adopts = self.add_adoptions(4, created_at=timezone.now().replace(microsecond=500000))
+        newest_first = [str(adopt.pk) for adopt in reversed(adopts)]
+
+        forward = self.walk('/api/adoptions/?page_size=1', 'next')
+        self.assertEqual(forward, newest_first)
+
+        last = self.client.get('/api/adoptions/?page_size=1')
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(backward, newest_first[:-1][::-1])
+
+
+class AdoptionRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dogs = Category.objects.create(name='Dog')
+        self.cats = Category.objects.create(name='Cat')
+        self.user = User.objects.create_user(email='family@example.com', password='secret')
+        credit(self.user.wallet.pk, Decimal('1000.00'))
+        self.adopt = Adopt.objects.create(user=self.user)
+        Adopt.objects.filter(pk=self.adopt.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+
+    def adopt_pets(self, *pets, days_ago=0, listed_days_before=2):
+        adopted_at = timezone.now() - timedelta(days=days_ago)
+        for pet in pets:
+            Pet.objects.filter(pk=pet.pk).update(created_at=adopted_at - timedelta(days=listed_days_before))
+        adopt_pets = checkout_pets(self.user, self.adopt.pk, [pet.pk for pet in pets])
+        AdoptPet.objects.filter(pk__in=[adopt_pet.pk for adopt_pet in adopt_pets]).update(created_at=adopted_at)
+
+    def create_pet(self, category, price):
+        return Pet.objects.create(
+            name='Pup', category=category, breed='Mixed', age=1, description='Friendly', price=price,
+        )
+
+    def get_stats(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        with self.assertNumQueries(3):
+            return client.get('/api/adoptions/stats/').data
+
+    def test_stats_read_the_rollups(self):
+        self.adopt_pets(self.create_pet(self.dogs, Decimal('100.00')), days_ago=1)
+        self.adopt_pets(self.create_pet(self.dogs, Decimal('50.00')), self.create_pet(self.cats, Decimal('30.00')))
+        refresh_rollups()
+
+        stats = self.get_stats()
+        self.assertEqual(stats['totals']['pets_adopted'], 3)
+        self.assertEqual(stats['totals']['revenue'], Decimal('180.00'))
+        self.assertEqual(stats['totals']['avg_days_to_adoption'], 2.0)
+        self.assertEqual(stats['totals']['adoptions'], 1)
+        self.assertEqual([(day['adoptions'], day['pets_adopted']) for day in stats['days']], [(1, 0), (0, 1), (0, 2)])
+        self.assertEqual(
+            [(row['category'], row['revenue']) for row in stats['categories']],
+            [('Dog', Decimal('150.00')), ('Cat', Decimal('30.00'))],
+        )
+
+    def test_refresh_only_touches_days_since_watermark(self):
+        self.adopt_pets(self.create_pet(self.dogs, Decimal('100.00')), days_ago=3)
+        refresh_rollups()
+        DailyAdoptionStats.objects.update(revenue=Decimal('1.00'))
+
+        self.adopt_pets(self.create_pet(self.cats, Decimal('30.00')))
+        refresh_rollups()
+
+        today = timezone.localdate()
+        self.assertEqual(
+            list(DailyAdoptionStats.objects.filter(pets_adopted__gt=0).values_list('day', 'revenue')),
+            [(today - timedelta(days=3), Decimal('1.00')), (today, Decimal('30.00'))],
+        )
+        refresh_rollups(full=True)
+        self.assertEqual(DailyAdoptionStats.objects.get(day=today - timedelta(days=3)).revenue, Decimal('100.00'))
+
+    def test_revenue_is_what_was_paid(self):
+        pet = self.create_pet(self.dogs, Decimal('100.00'))
+        self.adopt_pets(pet)
+        self.assertEqual(AdoptPet.objects.get(pet=pet).price, Decimal('100.00'))
+
+        Pet.objects.filter(pk=pet.pk).update(price=Decimal('5.00'))
+        refresh_rollups()
+        self.assertEqual(DailyAdoptionStats.objects.get(day=timezone.localdate()).revenue, Decimal('100.00'))
+        self.assertEqual(self.get_stats()['categories'][0]['revenue'], Decimal('100.00'))
+
+
+class AdoptionExportTests(TestCase):
+    """Adoption exports stream every adopted pet, filtered like the list, to staff only."""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Dog')
+        self.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+        self.adopts = []
+        for i, email in enumerate(['ann@example.com', 'bob@example.com', 'ann2@example.com']):
+            adopt = Adopt.objects.create(user=User.objects.create_user(email=email, password='secret'))
+            for j in range(2):
+                pet = Pet.objects.create(
+                    name=f'Pup {i}{j}', category=category, breed='Mixed', age=1, description='Friendly',
+                    price=Decimal('10.00') * (j + 1),
+                )
+                AdoptPet.objects.create(adopt=adopt, pet=pet, price=pet.price)
+            self.adopts.append(adopt)
+        Adopt.objects.filter(pk=self.adopts[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get('/api/adoptions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_streams_every_adopted_pet(self):
+        rows = list(csv.reader(StringIO(self.export())))
+        self.assertEqual(rows[0], [name for name, _ in ADOPTION_EXPORT_COLUMNS])
+        self.assertEqual(len(rows), 7)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['adoption_id'], str(self.adopts[0].pk))
+        self.assertEqual(first['user_email'], 'ann@example.com')
+        self.assertEqual((first['pet_name'], first['category'], first['price']), ('Pup 00', 'Dog', '10.00'))
+
+        response = self.client.get('/api/adoptions/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="adoptions.csv"')
+
+    def test_ndjson_streams_one_object_per_line(self):
+        lines = self.export(export_format='ndjson').splitlines()
+        self.assertEqual(len(lines), 6)
+        row = json.loads(lines[-1])
+        self.assertEqual(set(row), {name for name, _ in ADOPTION_EXPORT_COLUMNS})
+        self.assertEqual((row['user_email'], row['price']), ('ann2@example.com', '20.00'))
+
+    def test_filters_match_the_list(self):
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        for params in (
+            {},
+            {'user_id': self.adopts[1].user_id},
+            {'user__email': 'ann@example.com'},
+            {'created_at__gte': since},
+        ):
+            with self.subTest(params=params):
+                listed = {adopt['id'] for adopt in self.client.get('/api/adoptions/', params).data['results']}
+                exported = {
+                    row['adoption_id']
+                    for row in csv.DictReader(StringIO(self.export(**params)))
+                }
+                self.assertEqual(exported, {str(pk) for pk in listed})
+                self.assertTrue(exported)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/adoptions/export/', {'export_format': 'xml'}).status_code, 400)
+
+        self.client.force_authenticate(self.adopts[0].user)
+        self.assertEqual(self.client.get('/api/adoptions/export/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/adoptions/export/').status_code, 401)
+
+    def test_admin_action_exports_the_selection(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='secret'))
+        response = self.client.post('/admin/order/adopt/', {
+            'action': 'export_csv', '_selected_action': [self.adopts[1].pk],
+        })
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual({row['user_email'] for row in rows}, {'bob@example.com'})
+        self.assertEqual(len(rows), 2)
+
+
+class AdoptionAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Dog')
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='secret'))
+
+    def add_adoptions(self, count):
+        for i in range(count):
+            user = User.objects.create_user(email=f'family{Adopt.objects.count()}@example.com', password='secret')
+            pet = Pet.objects.create(name=f'Pup {i}', category=self.category, breed='Mixed', age=1, description='Friendly')
+            AdoptPet.objects.create(adopt=Adopt.objects.create(user=user), pet=pet)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for url in ('/admin/order/adopt/', '/admin/order/adoptpet/', '/admin/users/user/'):
+            self.add_adoptions(2)
+            few = self.count_queries(url)
+            self.add_adoptions(5)
+            self.assertEqual(self.count_queries(url), few, url)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Reads PostgreSQL row estimates')
+    def test_large_tables_are_counted_from_the_estimate(self):
+        self.add_adoptions(5)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {AdoptPet._meta.db_table}')
+
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(AdoptPet.objects.order_by('id'), 2).count, 5)
+        self.assertNotIn('COUNT(', queries[0]['sql'])
+
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(AdoptPet.objects.order_by('id'), 2).count, 5)
+        self.assertIn('COUNT(', queries[-1]['sql'])
@@ -1,26 +1,65 @@
+from functools import partial
+from django.db.models import Prefetch, Sum
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from .models import Adopt, AdoptPet
-from .serializers import AdoptSerializer, AdoptPetSerializer
+from rest_framework import status
+from rest_framework.response import Response
+from api.exports import EXPORT_FORMAT_PARAM, EXPORT_FORMATS, export_response, get_export_format
+from api.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from .checkout import checkout_pets
+from api.pagination import KeysetPagination
+from .exports import ADOPTION_EXPORT_COLUMNS, adoption_export_queryset
+from .filters import AdoptFilter
+from .models import Adopt, AdoptPet, DailyAdoptionStats, DailyCategoryStats
+from .serializers import (
+    AdoptSerializer, AdoptPetSerializer, AdoptPetBatchSerializer,
+    AdoptionStatsQuerySerializer, DailyAdoptionStatsSerializer, average_days,
+)
+
+class AdoptPagination(KeysetPagination):
+    ordering = '-created_at'
+
 
 class AdoptViewSet(ModelViewSet):
     serializer_class = AdoptSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AdoptPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AdoptFilter
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return super().get_serializer_context()
+        # A fixed number of queries per page: the adoptions joined with
+        # their users, then one prefetch each for wallets and pets.
+        wants = partial(self.get_serializer_class().wants_field, self.request)
+        queryset = Adopt.objects.all()
+        if wants('user_balance'):
+            queryset = queryset.select_related('user').prefetch_related('user__wallet')
+        if wants('adoptpets'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'adoptpets',
+                    queryset=AdoptPet.objects.select_related('pet__category')
+                    .only('id', 'adopt_id', 'pet__name', 'pet__breed', 'pet__category__name')
+                    .order_by('id'),
+                )
+            )
         if self.request.user.is_staff:
-            return Adopt.objects.prefetch_related('adoptpets__pet').all()
-        return Adopt.objects.prefetch_related('adoptpets__pet').filter(user=self.request.user)
+            return queryset.all()
+        return queryset.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     @swagger_auto_schema(
         operation_summary="List Adoptions",
-        operation_description="List all adoptions. Staff sees all, normal users see their own",
+        operation_description="List adoptions, newest first. Staff sees all, normal users see their own. "
+                              "Filter by `user_id`, `user__email` and `created_at__gte`/`created_at__lte`",
         responses={200: AdoptSerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
@@ -37,9 +76,11 @@ class AdoptViewSet(ModelViewSet):
     @swagger_auto_schema(
         operation_summary="Create Adoption",
         operation_description="Create a new adoption for the authenticated user",
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
         request_body=AdoptSerializer,
         responses={201: AdoptSerializer}
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
@@ -52,6 +93,81 @@ class AdoptViewSet(ModelViewSet):
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Export Adoptions",
+        operation_description="Staff only. Stream every adopted pet with its adoption, buyer email, "
+                              "category and price as CSV or NDJSON. Takes the same filters as the list",
+        manual_parameters=[
+            openapi.Parameter(EXPORT_FORMAT_PARAM, openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[*EXPORT_FORMATS]),
+        ],
+        responses={200: "CSV or NDJSON file"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        fmt = get_export_format(request)
+        adoptions = self.filter_queryset(self.get_queryset())
+        return export_response(adoption_export_queryset(adoptions), ADOPTION_EXPORT_COLUMNS, 'adoptions', fmt)
+
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Adoption History",
+        operation_description="The authenticated user's own adoptions, newest first, paginated like the list",
+        responses={200: AdoptSerializer(many=True)}
+    )
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Adoption Stats",
+        operation_description="Staff only. Adoptions, pets adopted, revenue and average days from listing to "
+                              "adoption per day, plus revenue per category, from `since` to `until` (the last "
+                              "30 days by default). Read from the rollups kept by refresh_adoption_rollups",
+        query_serializer=AdoptionStatsQuerySerializer,
+        responses={200: "Daily and per-category stats"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def stats(self, request):
+        params = AdoptionStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        span = (params.validated_data['since'], params.validated_data['until'])
+
+        days = DailyAdoptionStats.objects.filter(day__range=span)
+        totals = days.aggregate(
+            adoptions=Sum('adoptions'), pets_adopted=Sum('pets_adopted'), revenue=Sum('revenue'),
+            timed_pets=Sum('timed_pets'), time_to_adoption=Sum('time_to_adoption'),
+        )
+        categories = (
+            DailyCategoryStats.objects.filter(day__range=span)
+            .values('category_id', 'category__name')
+            .annotate(pets_adopted=Sum('pets_adopted'), revenue=Sum('revenue'))
+            .order_by('-revenue', 'category_id')
+        )
+        return Response({
+            'since': span[0],
+            'until': span[1],
+            'totals': {
+                'adoptions': totals['adoptions'] or 0,
+                'pets_adopted': totals['pets_adopted'] or 0,
+                'revenue': totals['revenue'] or 0,
+                'avg_days_to_adoption': average_days(totals['time_to_adoption'], totals['timed_pets']),
+            },
+            'days': DailyAdoptionStatsSerializer(days, many=True).data,
+            'categories': [
+                {
+                    'category_id': row['category_id'],
+                    'category': row['category__name'],
+                    'pets_adopted': row['pets_adopted'],
+                    'revenue': row['revenue'],
+                }
+                for row in categories
+            ],
+        })
+
 
 class AdoptPetViewSet(ModelViewSet):
     http_method_names = ['get', 'post']
@@ -61,7 +177,10 @@ class AdoptPetViewSet(ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return super().get_serializer_context()
         adopt_id = self.kwargs['adopt_pk']
-        return AdoptPet.objects.filter(adopt_id=adopt_id)
+        queryset = AdoptPet.objects.filter(adopt_id=adopt_id)
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(adopt__user=self.request.user)
 
     def get_serializer_class(self):
         return AdoptPetSerializer
@@ -83,9 +202,25 @@ class AdoptPetViewSet(ModelViewSet):
 
     @swagger_auto_schema(
         operation_summary="Add Pet to Adoption",
-        operation_description="Add a new pet to a specific adoption",
+        operation_description="Add a new pet to a specific adoption, or send `pet_ids` to adopt several pets "
+                              "at once; they are all adopted and paid for together or not at all",
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
         request_body=AdoptPetSerializer,
         responses={201: AdoptPetSerializer}
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
+        if 'pet_ids' in request.data:
+            return self.create_many(request)
         return super().create(request, *args, **kwargs)
+
+    def create_many(self, request):
+        serializer = AdoptPetBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        adopt_pets = checkout_pets(request.user, self.kwargs['adopt_pk'], serializer.validated_data['pet_ids'])
+        adopt_pets = (
+            AdoptPet.objects.filter(pk__in=[adopt_pet.pk for adopt_pet in adopt_pets])
+            .select_related('pet__category')
+            .order_by('id')
+        )
+        return Response(AdoptPetSerializer(adopt_pets, many=True).data, status=status.HTTP_201_CREATED)
@@ -1,5 +1,6 @@
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 import cloudinary
 
@@ -15,7 +16,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = False
+DEBUG = config('DEBUG', default=False, cast=bool)
 
 ALLOWED_HOSTS = [".vercel.app", '127.0.0.1']
 
@@ -170,7 +171,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING' : False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
@@ -181,6 +182,79 @@ REST_FRAMEWORK = {
 }
 
 
+# Cache versions (api.cache), idempotency locks and cached users must be
+# shared by every worker, or a write only invalidates the worker that made
+# it. The per-process LocMemCache is only allowed with DEBUG on; deploy
+# with e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://host:6379/0.
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+if CACHE_BACKEND.endswith('.LocMemCache') and not DEBUG:
+    raise ImproperlyConfigured(
+        "LocMemCache is per process; set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis"
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default='pet-haven'),
+    }
+}
+
+# Upper bound in seconds on how long a cached API response is served.
+# Writes invalidate entries earlier by bumping a version, see api.cache.
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=300, cast=int)
+FACETS_CACHE_TIMEOUT = config('FACETS_CACHE_TIMEOUT', default=60, cast=int)
+
+# Admin changelists of tables with more rows than this page by PostgreSQL's
+# row estimate instead of an exact count, see api.admin.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=50000, cast=int)
+
+# How long JWT-authenticated requests reuse a cached user, and whether it
+# carries the wallet balance and adoption count, see api.authentication.
+# Saves and queryset updates of a user drop its cached copy.
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+AUTH_USER_CACHE_PROFILE = config('AUTH_USER_CACHE_PROFILE', default=True, cast=bool)
+
+# How long a response is replayed for its Idempotency-Key, and how long a
+# repeat waits for the first request to finish, see api.idempotency.
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=30, cast=int)
+
+# Rows per insert batch (and transaction) for bulk pet imports.
+PET_IMPORT_BATCH_SIZE = config('PET_IMPORT_BATCH_SIZE', default=500, cast=int)
+
+# Rows fetched per server-side cursor round trip by the staff exports.
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# snapshot_wallets records a balance snapshot for wallets with at least
+# this many ledger entries since their last one.
+WALLET_SNAPSHOT_MIN_ENTRIES = config('WALLET_SNAPSHOT_MIN_ENTRIES', default=50, cast=int)
+
+# Where pet images are uploaded; pets.storage.LocalImageStorage writes to
+# MEDIA_ROOT instead of Cloudinary. Multi-image uploads run concurrently on
+# at most PET_IMAGE_UPLOAD_WORKERS threads.
+PET_IMAGE_STORAGE = config('PET_IMAGE_STORAGE', default='pets.storage.CloudinaryImageStorage')
+PET_IMAGE_UPLOAD_WORKERS = config('PET_IMAGE_UPLOAD_WORKERS', default=4, cast=int)
+PET_IMAGE_UPLOAD_MAX_FILES = config('PET_IMAGE_UPLOAD_MAX_FILES', default=10, cast=int)
+
+# Thumbnail and medium copies of pet images (WEBP or JPEG), rendered on
+# background threads after upload, see pets.derivatives. Those threads do
+# not outlive a serverless request; run generate_image_derivatives on a
+# schedule to fill in any that were lost.
+PET_IMAGE_DERIVATIVE_FORMAT = config('PET_IMAGE_DERIVATIVE_FORMAT', default='WEBP')
+PET_IMAGE_DERIVATIVE_QUALITY = config('PET_IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+PET_IMAGE_DERIVATIVE_WORKERS = config('PET_IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
+# Seconds to wait on the image host when reading an original back.
+PET_IMAGE_READ_TIMEOUT = config('PET_IMAGE_READ_TIMEOUT', default=30, cast=int)
+
+# How long a pet stays reserved for the user who held it, see pets.holds.
+PET_HOLD_SECONDS = config('PET_HOLD_SECONDS', default=300, cast=int)
+
+# How many pets one batch checkout may claim, see order.checkout. All of
+# them stay locked until the checkout commits.
+CHECKOUT_MAX_PETS = config('CHECKOUT_MAX_PETS', default=50, cast=int)
+
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'USER_CREATE_PASSWORD_RETYPE': True,
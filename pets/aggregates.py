@@ -0,0 +1,73 @@
+from collections import Counter, defaultdict
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Category, Pet
+
+
+def apply_review_delta(pet_id, added=None, removed=None):
+    """
+    Shift a pet's rating aggregates by one review rating added and/or removed.
+
+    Runs as a single UPDATE of F() expressions, so it must be called inside
+    the transaction that writes the review itself.
+    """
+    count = (added is not None) - (removed is not None)
+    total = (added or 0) - (removed or 0)
+    histogram = Counter()
+    if added is not None:
+        histogram[added] += 1
+    if removed is not None:
+        histogram[removed] -= 1
+
+    updates = {
+        f'rating_{rating}': F(f'rating_{rating}') + delta
+        for rating, delta in histogram.items() if delta
+    }
+    if not updates:
+        return
+
+    updates['review_count'] = F('review_count') + count
+    updates['rating_sum'] = F('rating_sum') + total
+    updates['rating_avg'] = Coalesce(
+        Cast(F('rating_sum') + total, FloatField()) / NullIf(F('review_count') + count, 0),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+    Pet.objects.filter(pk=pet_id).update(**updates)
+
+
+def category_counts(is_adopted, availability):
+    """The contribution of one pet to its category's counters."""
+    available = not is_adopted
+    return {
+        'pet_count': 1,
+        'available_pet_count': int(available),
+        'public_available_pet_count': int(available and availability == Pet.Availability.PUBLIC),
+    }
+
+
+def apply_category_deltas(deltas):
+    """
+    Apply `{category_id: {counter: delta}}` with one F() UPDATE per category
+    that actually changes. Call inside the transaction that moved the pets.
+    """
+    for category_id, counters in deltas.items():
+        updates = {name: F(name) + delta for name, delta in counters.items() if delta}
+        if category_id is not None and updates:
+            Category.objects.filter(pk=category_id).update(**updates)
+
+
+def move_pet_in_category_counts(old, new):
+    """
+    Move one pet's contribution from its `old` to its `new` state, each a
+    dict of `category_id`, `is_adopted` and `availability` or None when the
+    pet did not or no longer exists.
+    """
+    deltas = defaultdict(Counter)
+    if old is not None:
+        deltas[old['category_id']].subtract(category_counts(old['is_adopted'], old['availability']))
+    if new is not None:
+        deltas[new['category_id']].update(category_counts(new['is_adopted'], new['availability']))
+    apply_category_deltas(deltas)
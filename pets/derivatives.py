@@ -0,0 +1,94 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from api.cache import invalidate
+from .models import PetImage
+from .storage import get_image_storage
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes; images are scaled down to fit, never up.
+DERIVATIVE_SIZES = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = None
+
+
+def render(original, size, fmt):
+    image = original.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    if fmt == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if fmt != 'JPEG' and image.has_transparency_data else 'RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=settings.PET_IMAGE_DERIVATIVE_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_derivatives(image, storage=None):
+    """Render, store and record every size in DERIVATIVE_SIZES for one PetImage."""
+    storage = storage or get_image_storage()
+    fmt = settings.PET_IMAGE_DERIVATIVE_FORMAT
+    values = {}
+    with Image.open(io.BytesIO(storage.read(image.image))) as original:
+        original = ImageOps.exif_transpose(original)
+        for label, size in DERIVATIVE_SIZES.items():
+            content = render(original, size, fmt)
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            values[label] = storage.save_derivative(image.image, f'{label}_{digest}', content, EXTENSIONS[fmt])
+
+    PetImage.objects.filter(pk=image.pk).update(**values)
+    for label, value in values.items():
+        setattr(image, label, value)
+    return values
+
+
+def generate_for_images(images, storage=None):
+    """Generate derivatives for `images`, logging and skipping any that fail."""
+    storage = storage or get_image_storage()
+    done = 0
+    for image in images:
+        try:
+            generate_derivatives(image, storage)
+        except Exception:
+            logger.exception("Could not generate derivatives for pet image %s", image.pk)
+        else:
+            done += 1
+    if done:
+        invalidate('pets')
+    return done
+
+
+def _generate_in_background(image_ids):
+    try:
+        generate_for_images(PetImage.objects.filter(pk__in=image_ids).only('id', 'image'))
+    finally:
+        connections.close_all()
+
+
+def schedule_derivatives(image_ids):
+    """
+    Generate derivatives on a background thread once the current
+    transaction commits, keeping Pillow and the storage round trips out
+    of the request.
+
+    Nothing records the job itself: an image whose derivatives never got
+    written, say because a serverless function was frozen after its
+    response, keeps an empty `thumbnail` or `medium`, which is what
+    generate_image_derivatives picks up.
+    """
+    global _executor
+    image_ids = list(image_ids)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PET_IMAGE_DERIVATIVE_WORKERS, thread_name_prefix='pet-image-derivatives',
+        )
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, image_ids))
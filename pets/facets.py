@@ -0,0 +1,77 @@
+from collections import Counter
+
+from django.db.models import Count, Q
+
+from .models import Pet
+
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 250), (250, 500), (500, None)]
+AGE_BUCKETS = [(0, 1), (1, 3), (3, 7), (7, None)]
+
+
+def bucket_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def bucket_filter(field, low, high):
+    bounds = Q(**{f'{field}__gte': low})
+    if high is not None:
+        bounds &= Q(**{f'{field}__lt': high})
+    return bounds
+
+
+def bucket_counts(field, buckets):
+    return {
+        f'{field}_{index}': Count('id', filter=bucket_filter(field, low, high))
+        for index, (low, high) in enumerate(buckets)
+    }
+
+
+def counts(items):
+    """`[{'value', 'count'}]` for the non-zero counts in `items`, most common first."""
+    return [{'value': value, 'count': count} for value, count in Counter(dict(items)).most_common() if count]
+
+
+def compute_facets(queryset, include_availability=True):
+    """
+    Count `queryset` by category, breed, adoption status, availability and
+    price and age bucket.
+
+    The bounded facets (adoption status, availability and the buckets) are
+    conditional counts in one aggregate query. Category and breed get a
+    GROUP BY each, so every query returns at most one row per facet value
+    however many combinations of values the catalogue holds.
+    """
+    queryset = queryset.order_by().prefetch_related(None)
+    availabilities = Pet.Availability.values
+    aggregates = {
+        'total': Count('id'),
+        'adopted': Count('id', filter=Q(is_adopted=True)),
+        **{f'availability_{value}': Count('id', filter=Q(availability=value)) for value in availabilities},
+        **bucket_counts('price', PRICE_BUCKETS),
+        **bucket_counts('age', AGE_BUCKETS),
+    }
+    totals = queryset.aggregate(**aggregates)
+    categories = (
+        queryset.values('category_id', 'category__name').annotate(count=Count('id')).order_by('-count', 'category__name')
+    )
+    breeds = queryset.values('breed').annotate(count=Count('id')).order_by('-count', 'breed')
+
+    result = {
+        'total': totals['total'],
+        'category': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']} for row in categories
+        ],
+        'breed': [{'value': row['breed'], 'count': row['count']} for row in breeds],
+        'is_adopted': counts([(True, totals['adopted']), (False, totals['total'] - totals['adopted'])]),
+        'price': [
+            {'bucket': bucket_label(low, high), 'count': totals[f'price_{index}']}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'age': [
+            {'bucket': bucket_label(low, high), 'count': totals[f'age_{index}']}
+            for index, (low, high) in enumerate(AGE_BUCKETS)
+        ],
+    }
+    if include_availability:
+        result['availability'] = counts((value, totals[f'availability_{value}']) for value in availabilities)
+    return result
@@ -1,5 +1,8 @@
+from django.db import connections
 from django_filters.rest_framework import FilterSet
+from rest_framework.filters import SearchFilter
 from pets.models import Pet
+from pets.search import search_pets
 
 class PetFilter(FilterSet):
     class Meta:
@@ -7,4 +10,26 @@ class PetFilter(FilterSet):
         fields = {
             'category_id': ['exact'],
             'is_adopted': ['exact'],
+            'price': ['gte', 'lte'],
+            'age': ['gte', 'lte'],
+            'breed': ['exact', 'startswith', 'gte', 'lte'],
         }
+
+
+class PetSearchFilter(SearchFilter):
+    """
+    Ranked full-text search over name, breed and description, see
+    pets.search. Falls back to SearchFilter's icontains lookups on databases
+    without full-text support.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        vendor = connections[queryset.db].vendor
+        results = search_pets(queryset, terms, vendor)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+
+from api.exceptions import Conflict
+from .models import Pet
+
+
+def holdable_by(user, now):
+    """Pets `user` may hold or check out at `now`: not held, held by them, or held past expiry."""
+    return Q(held_by__isnull=True) | Q(held_by=user) | Q(held_until__lte=now)
+
+
+def hold_pet(user, pet_id):
+    """
+    Reserve `pet_id` for `user` for PET_HOLD_SECONDS, or extend their own
+    hold, and return when it expires.
+
+    The hold is taken by one conditional UPDATE, so of several users racing
+    for a pet exactly one gets it. The others get a Conflict (409) without
+    reaching the checkout or their wallet.
+    """
+    now = timezone.now()
+    held_until = now + timedelta(seconds=settings.PET_HOLD_SECONDS)
+    if Pet.objects.filter(holdable_by(user, now), pk=pet_id, is_adopted=False).update(held_by=user, held_until=held_until):
+        return held_until
+
+    pet = Pet.objects.filter(pk=pet_id).values('name', 'is_adopted').first()
+    if pet is None:
+        raise NotFound("Pet does not exist")
+    if pet['is_adopted']:
+        raise Conflict(f"Already adopted: {pet['name']}")
+    raise Conflict(f"Pet '{pet['name']}' is held by another user")
+
+
+def release_pet(user, pet_id):
+    """Drop `user`'s hold on `pet_id`, returning whether they had one."""
+    return bool(Pet.objects.filter(pk=pet_id, held_by=user).update(held_by=None, held_until=None))
+
+
+def release_expired_holds():
+    """Clear every hold past its expiry, returning how many were cleared."""
+    return Pet.objects.filter(held_until__lte=timezone.now()).update(held_by=None, held_until=None)
@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from api.cache import invalidate
+from .aggregates import apply_category_deltas, category_counts
+from .models import Category, Pet
+from .serializers import PetImportSerializer
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Columns written by COPY; the aggregates have no database default and
+# COPY skips created_at's auto_now_add, so build() sets it.
+COPY_COLUMNS = (
+    'name', 'category_id', 'breed', 'age', 'description', 'price', 'is_adopted', 'availability', 'created_at',
+) + Pet.AGGREGATE_FIELDS
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Lazily yield `(row_number, row, error)` from a binary stream of CSV with
+    a header line or of JSON objects one per line.
+
+    A file that is not UTF-8, or CSV the parser cannot make sense of, ends
+    the stream with an error for the row it failed on; the rows before it
+    are still imported.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    number = 0
+    try:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(text), start=1):
+                yield number, row, None
+            return
+
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, None, str(exc)
+                continue
+            if not isinstance(row, dict):
+                yield number, None, 'Expected a JSON object.'
+                continue
+            yield number, row, None
+    except (UnicodeDecodeError, csv.Error) as exc:
+        yield number + 1, None, f'Could not read the rest of the file: {exc}'
+
+
+class PetImporter:
+    """
+    Validate and insert pets in batches of `batch_size` rows.
+
+    Categories are resolved by name from one lookup up front, ignoring case
+    unless several categories differ only in case. Each batch is
+    inserted with `bulk_create` (or COPY on PostgreSQL when `use_copy` is
+    set) in its own transaction together with the category counter deltas,
+    so a bad batch never aborts the rest of the file. At most `max_errors`
+    row errors are kept; `failed` still counts all of them.
+    """
+
+    def __init__(self, batch_size=500, use_copy=False, max_errors=1000):
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.max_errors = max_errors
+        self.categories = {}
+        self.folded_categories = defaultdict(list)
+        for name, pk in Category.objects.values_list('name', 'id'):
+            self.categories[name] = pk
+            self.folded_categories[name.lower()].append(pk)
+        self.validator = PetImportSerializer()
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        batch = []
+        for number, row, error in rows:
+            pet = self.build(number, row, error)
+            if pet is None:
+                continue
+            batch.append((number, pet))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def build(self, number, row, error):
+        if error is not None:
+            self.add_error(number, {'non_field_errors': [error]})
+            return None
+        # Blank CSV cells mean "not given", so optional columns get defaults.
+        row = {key: value for key, value in row.items() if key is not None and value not in ('', None)}
+        try:
+            data = self.validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            self.add_error(number, exc.detail)
+            return None
+
+        category = data.pop('category')
+        matches = self.folded_categories.get(category.lower(), [])
+        category_id = self.categories.get(category, matches[0] if len(matches) == 1 else None)
+        if category_id is None:
+            if len(matches) > 1:
+                self.add_error(number, {'category': ['Several categories match this name; use its exact spelling.']})
+            else:
+                self.add_error(number, {'category': ['Category does not exist.']})
+            return None
+        return Pet(category_id=category_id, created_at=timezone.now(), **data)
+
+    def flush(self, batch):
+        pets = [pet for _, pet in batch]
+        deltas = defaultdict(Counter)
+        for pet in pets:
+            deltas[pet.category_id].update(category_counts(pet.is_adopted, pet.availability))
+
+        try:
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy(pets)
+                else:
+                    Pet.objects.bulk_create(pets)
+                apply_category_deltas(deltas)
+                invalidate('pets', 'categories')
+        except DatabaseError as exc:
+            for number, _ in batch:
+                self.add_error(number, {'non_field_errors': [str(exc).strip()]})
+            return
+        self.created += len(pets)
+
+    def copy(self, pets):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for pet in pets:
+            writer.writerow([getattr(pet, column) for column in COPY_COLUMNS])
+        buffer.seek(0)
+        sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            connection.ops.quote_name(Pet._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in COPY_COLUMNS),
+        )
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(sql, buffer)
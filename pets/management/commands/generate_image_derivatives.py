@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from pets.derivatives import generate_for_images
+from pets.models import PetImage
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail and medium derivatives for pet images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate derivatives for every image")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        images = PetImage.objects.only('id', 'image').order_by('id')
+        if not options['all']:
+            images = images.filter(Q(thumbnail='') | Q(medium=''))
+
+        total = images.count()
+        done = generate_for_images(images.iterator(chunk_size=options['batch_size']))
+        if done < total:
+            self.stderr.write(f"{total - done} images failed, see the log")
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {done} images"))
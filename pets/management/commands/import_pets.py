@@ -0,0 +1,37 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pets.importers import IMPORT_FORMATS, PetImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Stream pets from a CSV (with header) or JSONL file into the database in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS)
+        parser.add_argument('--batch-size', type=int, default=settings.PET_IMPORT_BATCH_SIZE)
+        parser.add_argument('--copy', action='store_true', help="Insert with COPY on PostgreSQL")
+        parser.add_argument('--max-errors', type=int, default=1000, help="How many row errors to report")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        importer = PetImporter(
+            batch_size=options['batch_size'], use_copy=options['copy'], max_errors=options['max_errors'],
+        )
+
+        try:
+            with open(path, 'rb') as stream:
+                result = importer.run(read_rows(stream, fmt))
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        if result['failed'] > len(result['errors']):
+            self.stderr.write(f"... {result['failed'] - len(result['errors'])} more rows failed")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} pets, {result['failed']} rows failed"
+        ))
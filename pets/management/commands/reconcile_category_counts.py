@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from api.cache import invalidate
+from pets.models import Category, Pet
+
+
+class Command(BaseCommand):
+    help = "Recount every category's pet counters from the Pet table and fix any drift"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Locking the categories first makes concurrent pet writes wait,
+            # so their counter deltas land on top of the fresh counts.
+            categories = list(Category.objects.select_for_update().order_by('id'))
+            available = Q(is_adopted=False)
+            counts = {
+                row.pop('category_id'): row
+                for row in Pet.objects.values('category_id').annotate(
+                    pet_count=Count('id'),
+                    available_pet_count=Count('id', filter=available),
+                    public_available_pet_count=Count(
+                        'id', filter=available & Q(availability=Pet.Availability.PUBLIC)
+                    ),
+                ).order_by()
+            }
+
+            drifted = []
+            for category in categories:
+                row = counts.get(category.id, {})
+                expected = {field: row.get(field, 0) for field in Category.COUNTER_FIELDS}
+                if any(getattr(category, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(category, field, value)
+                    drifted.append(category)
+
+            if drifted:
+                Category.objects.bulk_update(drifted, Category.COUNTER_FIELDS)
+                # bulk_update sends no post_save, see pets.signals.
+                invalidate('categories')
+
+        for category in drifted:
+            self.stdout.write(f"Corrected counters for category {category.id} ({category.name})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(categories)} categories, corrected {len(drifted)}"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from pets.holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Clear pet holds past their expiry. Expired holds are already ignored; run this periodically to tidy up"
+
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds"))
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:47
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    CREATE FUNCTION pets_pet_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.breed, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER pets_pet_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, breed, description ON pets_pet
+    FOR EACH ROW EXECUTE FUNCTION pets_pet_search_vector_update()
+    """,
+    "UPDATE pets_pet SET name = name",
+    "CREATE INDEX pet_search_vector_idx ON pets_pet USING GIN (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS pet_search_vector_idx",
+    "DROP TRIGGER IF EXISTS pets_pet_search_vector_trigger ON pets_pet",
+    "DROP FUNCTION IF EXISTS pets_pet_search_vector_update()",
+]
+
+
+def postgres_only(statements):
+    # SQLite gets an FTS5 table instead, see pets.search.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0008_pet_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pet',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(postgres_only(POSTGRES_FORWARD), postgres_only(POSTGRES_REVERSE)),
+    ]
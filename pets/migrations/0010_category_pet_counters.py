@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_pets(apps, schema_editor):
+    Category = apps.get_model('pets', 'Category')
+    Pet = apps.get_model('pets', 'Pet')
+    available = Q(is_adopted=False)
+    rows = Pet.objects.values('category_id').annotate(
+        pet_count=Count('id'),
+        available_pet_count=Count('id', filter=available),
+        public_available_pet_count=Count('id', filter=available & Q(availability='Public')),
+    ).order_by()
+    for row in rows:
+        Category.objects.filter(pk=row.pop('category_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0009_pet_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_pet_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='pet_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='public_available_pet_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_pets, migrations.RunPython.noop),
+    ]
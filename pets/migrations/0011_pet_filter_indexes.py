@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0010_category_pet_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['availability', 'id'], name='pet_availability_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['availability', 'category', 'id'], name='pet_avail_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('availability', 'Public'), ('is_adopted', False)), fields=['category', 'id'], name='pet_open_public_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['price', 'id'], name='pet_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['age', 'id'], name='pet_age_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['breed', 'id'], name='pet_breed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['breed'], name='pet_breed_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0011_pet_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petimage',
+            name='medium',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='petimage',
+            name='thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
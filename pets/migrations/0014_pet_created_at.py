@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0013_pet_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pet',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+    ]
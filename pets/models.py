@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.contrib.postgres.search import SearchVectorField
 from cloudinary.models import CloudinaryField
 
 # Create your models here.
@@ -8,13 +9,35 @@ class Category(models.Model):
     name = models.CharField(max_length=30)
     description = models.TextField(blank=True, null=True)
 
+    # Pet counters, maintained incrementally by pets.aggregates.
+    pet_count = models.PositiveIntegerField(default=0, editable=False)
+    available_pet_count = models.PositiveIntegerField(default=0, editable=False)
+    public_available_pet_count = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('pet_count', 'available_pet_count', 'public_available_pet_count')
+
     class Meta:
         ordering = ['name',]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # Counters are only ever written with F() updates.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
 
+class PetManager(models.Manager):
+    def get_queryset(self):
+        # The search vector is only ever read inside the database.
+        return super().get_queryset().defer('search_vector')
+
+
 class Pet(models.Model):
     name = models.CharField(max_length=50)
     category = models.ForeignKey(Category, on_delete=models.CASCADE,  related_name='pets')
@@ -23,6 +46,8 @@ class Pet(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     is_adopted = models.BooleanField(default=False)
+    # Null for pets listed before this was recorded.
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
 
     class Availability(models.TextChoices):
         PUBLIC = 'Public'
@@ -34,15 +59,116 @@ class Pet(models.Model):
         default=Availability.PUBLIC
     )
 
+    # Review aggregates, maintained incrementally by pets.aggregates.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    AGGREGATE_FIELDS = (
+        'review_count', 'rating_sum', 'rating_avg',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    )
+
+    # Filled by a database trigger from name, breed and description, see
+    # migration 0009. Unused on SQLite, which searches an FTS5 table instead.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Checkout reservation, taken and released by pets.holds. A hold past
+    # held_until is free again, whether or not it was swept yet.
+    held_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
+    held_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    HOLD_FIELDS = ('held_by', 'held_until')
+
+    objects = PetManager()
+
     class Meta:
         ordering = ['id',]
+        indexes = [
+            models.Index(fields=['rating_avg', 'id'], name='pet_rating_avg_idx'),
+            # Anonymous catalogue: public pets in id order, optionally by category.
+            models.Index(fields=['availability', 'id'], name='pet_availability_id_idx'),
+            models.Index(fields=['availability', 'category', 'id'], name='pet_avail_category_id_idx'),
+            # Public pets still up for adoption, the storefront's default view.
+            models.Index(
+                fields=['category', 'id'],
+                name='pet_open_public_cat_idx',
+                condition=models.Q(availability='Public', is_adopted=False),
+            ),
+            # Range filters, which double as keyset orderings.
+            models.Index(fields=['price', 'id'], name='pet_price_id_idx'),
+            models.Index(fields=['age', 'id'], name='pet_age_id_idx'),
+            models.Index(fields=['breed', 'id'], name='pet_breed_id_idx'),
+            # LIKE 'prefix%' on PostgreSQL under a non-C collation.
+            models.Index(fields=['breed'], name='pet_breed_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # The expired hold sweep.
+            models.Index(fields=['held_until'], name='pet_held_until_idx', condition=models.Q(held_until__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        from .aggregates import move_pet_in_category_counts
+
+        # Aggregates are only ever written with F() updates, the search
+        # vector by its trigger and holds by conditional updates; saving a
+        # loaded pet must not write them back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.AGGREGATE_FIELDS
+                and field.name not in self.HOLD_FIELDS
+                and field.name != 'search_vector'
+            ]
+
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                # Lock the row so the category counters move from the state
+                # actually being replaced, not the one this instance loaded.
+                old = (
+                    Pet.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('category_id', 'is_adopted', 'availability')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            new = {
+                'category_id': self.category_id,
+                'is_adopted': self.is_adopted,
+                'availability': self.availability,
+            }
+            move_pet_in_category_counts(old, new)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # As in save, the post_delete counter update must see the stored
+            # state of the pet rather than the one this instance loaded.
+            stored = (
+                Pet.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values('category_id', 'is_adopted', 'availability')
+                .first()
+            )
+            for field, value in (stored or {}).items():
+                setattr(self, field, value)
+            return super().delete(*args, **kwargs)
     
 class PetImage(models.Model):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='images')
     image = CloudinaryField('image')
+    # Resized copies stored next to the original, see pets.derivatives.
+    thumbnail = models.CharField(max_length=255, blank=True, editable=False)
+    medium = models.CharField(max_length=255, blank=True, editable=False)
 
 class Review(models.Model):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='reviews')
@@ -0,0 +1,70 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+# SQLite has no tsvector, so local runs search an external-content FTS5
+# table kept in sync by triggers. SQLite drops triggers whenever a migration
+# rebuilds pets_pet, so this is (re)installed after every migrate instead of
+# living in a migration.
+SQLITE_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS pets_pet_fts USING fts5(
+        name, breed, description, content='pets_pet', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pets_pet_fts_insert AFTER INSERT ON pets_pet BEGIN
+        INSERT INTO pets_pet_fts(rowid, name, breed, description)
+        VALUES (new.id, new.name, new.breed, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pets_pet_fts_delete AFTER DELETE ON pets_pet BEGIN
+        INSERT INTO pets_pet_fts(pets_pet_fts, rowid, name, breed, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pets_pet_fts_update AFTER UPDATE OF name, breed, description ON pets_pet BEGIN
+        INSERT INTO pets_pet_fts(pets_pet_fts, rowid, name, breed, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.description);
+        INSERT INTO pets_pet_fts(rowid, name, breed, description)
+        VALUES (new.id, new.name, new.breed, new.description);
+    END
+    """,
+    "INSERT INTO pets_pet_fts(pets_pet_fts) VALUES ('rebuild')",
+]
+
+
+def install_sqlite_fts(connection):
+    with connection.cursor() as cursor:
+        for statement in SQLITE_FTS_SCHEMA:
+            cursor.execute(statement)
+
+
+def search_pets(queryset, terms, vendor):
+    """
+    Restrict `queryset` to pets matching every term and annotate
+    `search_rank` (higher is better). Returns None when the database has no
+    full-text support.
+    """
+    if vendor == 'postgresql':
+        query = SearchQuery(' '.join(terms), config='english', search_type='websearch')
+        # ts_rank is a float4; widen it so the value survives a JSON cursor.
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return queryset.filter(search_vector=query).annotate(search_rank=rank)
+
+    if vendor == 'sqlite':
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        rank = RawSQL(
+            # Column weights mirror the A/A/B weights of the PostgreSQL vector.
+            'SELECT -bm25(pets_pet_fts, 10.0, 10.0, 1.0) FROM pets_pet_fts '
+            'WHERE pets_pet_fts MATCH %s AND pets_pet_fts.rowid = pets_pet.id',
+            (match,),
+            output_field=FloatField(),
+        )
+        matches = RawSQL('SELECT rowid FROM pets_pet_fts WHERE pets_pet_fts MATCH %s', (match,))
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+
+    return None
@@ -1,5 +1,11 @@
 from .models import Category, Pet, PetImage, Review
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from api.serializers import DynamicFieldsMixin
+from .aggregates import apply_review_delta
 from pets.models import Pet
 from order.models import AdoptPet
 
@@ -12,7 +18,15 @@ class CategorySerializer(serializers.ModelSerializer):
 class PetImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = PetImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnail', 'medium']
+
+class PetImageUploadSerializer(serializers.Serializer):
+    """Several images for one pet, uploaded as repeated `images` form fields."""
+    images = serializers.ListField(
+        child=serializers.ImageField(),
+        allow_empty=False,
+        max_length=settings.PET_IMAGE_UPLOAD_MAX_FILES,
+    )
 
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,19 +34,30 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'pet_id', 'pet', 'user', 'rating', 'comment']
         read_only_fields = ['pet', 'user']
 
+    already_reviewed_message = "You have already reviewed this pet."
+
     def validate(self, attrs):
+        if self.instance is not None:
+            return attrs
+
         pet_id = self.context['pet_id']
         user = self.context['user']
 
-        if Review.objects.filter(pet_id=pet_id, user=user).exists():
-            raise serializers.ValidationError("You have already reviewed this pet.")
-
-        pet = Pet.objects.get(id=pet_id)
-        if not pet.is_adopted:
+        # One query decides eligibility; duplicates are left to the
+        # unique_together constraint, see create().
+        eligibility = (
+            Pet.objects.filter(pk=pet_id)
+            .annotate(adopted_by_user=Exists(AdoptPet.objects.filter(pet=OuterRef('pk'), adopt__user=user)))
+            .values_list('is_adopted', 'adopted_by_user')
+            .first()
+        )
+        if eligibility is None:
+            raise serializers.ValidationError("Pet does not exist")
+
+        is_adopted, adopted_by_user = eligibility
+        if not is_adopted:
             raise serializers.ValidationError("You can only review pets that are adopted.")
-
-        adopted = AdoptPet.objects.filter(pet=pet, adopt__user=user).exists()
-        if not adopted:
+        if not adopted_by_user:
             raise serializers.ValidationError("You can only review pets you have adopted.")
 
         return attrs
@@ -40,7 +65,20 @@ class ReviewSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['user']
         pet_id = self.context['pet_id']
-        return Review.objects.create(user=user, pet_id=pet_id, **validated_data)
+        try:
+            with transaction.atomic():
+                review = Review.objects.create(user=user, pet_id=pet_id, **validated_data)
+                apply_review_delta(review.pet_id, added=review.rating)
+        except IntegrityError:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [self.already_reviewed_message]})
+        return review
+
+    def update(self, instance, validated_data):
+        old_rating = instance.rating
+        with transaction.atomic():
+            review = super().update(instance, validated_data)
+            apply_review_delta(review.pet_id, added=review.rating, removed=old_rating)
+        return review
 
 
 class SimpleReviewSerializer(serializers.ModelSerializer):
@@ -51,16 +89,31 @@ class SimpleReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'rating', 'comment']
 
 
-class PetSerializer(serializers.ModelSerializer):
+class PetSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     images = PetImageSerializer(many=True, read_only=True)
     reviews = SimpleReviewSerializer(many=True, read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
     
     class Meta:
         model = Pet
         fields = [
             'id', 'name', 'category', 'breed', 'age', 'price',
-            'description', 'is_adopted', 'availability', 'images', 'reviews'
+            'description', 'is_adopted', 'availability', 'images', 'reviews',
+            'review_count', 'rating_avg', 'rating_histogram', 'thumbnail'
         ]
+        expandable_fields = ['images', 'reviews', 'thumbnail']
+        default_expand = ['images', 'reviews']
+
+    def get_rating_histogram(self, obj):
+        return {str(rating): getattr(obj, f'rating_{rating}') for rating in range(1, 6)}
+
+    def get_thumbnail(self, obj):
+        images = obj.images.all()
+        if not images:
+            return None
+        image = PetImageSerializer(images[0]).data
+        return image['thumbnail'] or image['image']
 
     def get_fields(self):
         fields = super().get_fields()
@@ -72,12 +125,25 @@ class PetSerializer(serializers.ModelSerializer):
         user = request.user
         
         if not user.is_staff:
-            fields['is_adopted'].read_only = True 
+            if 'is_adopted' in fields:
+                fields['is_adopted'].read_only = True 
             fields.pop('availability', None)
 
         return fields
 
 
+class PetImportSerializer(serializers.Serializer):
+    """One row of a bulk pet import; `category` is the category's name."""
+    name = serializers.CharField(max_length=50)
+    category = serializers.CharField(max_length=30)
+    breed = serializers.CharField(max_length=50)
+    age = serializers.DecimalField(max_digits=10, decimal_places=2)
+    description = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
+    is_adopted = serializers.BooleanField(required=False, default=False)
+    availability = serializers.ChoiceField(choices=Pet.Availability.choices, required=False, default=Pet.Availability.PUBLIC)
+
+
 class SimplePetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pet
@@ -0,0 +1,61 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.cache import invalidate
+from .aggregates import apply_review_delta, move_pet_in_category_counts
+from .derivatives import schedule_derivatives
+from .models import Category, Pet, PetImage, Review
+
+
+def deleted_with(origin, *models):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, origin=None, **kwargs):
+    # post_delete runs inside the deletion's transaction, which also covers
+    # reviews removed by a cascade from their user. A cascade from the pet
+    # or its category deletes the pet too, leaving nothing to update.
+    if deleted_with(origin, Pet, Category):
+        return
+    apply_review_delta(instance.pet_id, removed=instance.rating)
+
+
+@receiver(post_delete, sender=Pet)
+def remove_pet_from_category_counts(sender, instance, origin=None, **kwargs):
+    # A cascade from the category deletes the counters along with the pets.
+    if deleted_with(origin, Category):
+        return
+    old = {
+        'category_id': instance.category_id,
+        'is_adopted': instance.is_adopted,
+        'availability': instance.availability,
+    }
+    move_pet_in_category_counts(old, None)
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_delete, sender=Pet)
+def invalidate_pets_and_categories(sender, **kwargs):
+    invalidate('pets', 'categories')
+
+
+@receiver(post_save, sender=PetImage)
+def generate_image_derivatives(sender, instance, created, **kwargs):
+    if created:
+        schedule_derivatives([instance.pk])
+
+
+@receiver(post_save, sender=PetImage)
+@receiver(post_delete, sender=PetImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_pets(sender, **kwargs):
+    invalidate('pets')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, **kwargs):
+    invalidate('categories')
@@ -0,0 +1,99 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from cloudinary import uploader
+from cloudinary.models import CloudinaryField
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+
+_image_field = CloudinaryField('image')
+
+
+def as_resource(value):
+    """A stored image value, as read from the database or from `save`."""
+    return _image_field.to_python(value)
+
+
+class CloudinaryImageStorage:
+    """Upload pet images to Cloudinary, as CloudinaryField does on save."""
+
+    def save(self, file):
+        if hasattr(file, 'seekable') and file.seekable():
+            file.seek(0)
+        return uploader.upload_resource(file, type='upload', resource_type='image').get_prep_value()
+
+    def save_derivative(self, original, suffix, content, extension):
+        public_id = f'{as_resource(original).public_id}_{suffix}'
+        return uploader.upload_resource(
+            io.BytesIO(content), public_id=public_id, format=extension, type='upload', resource_type='image',
+        ).get_prep_value()
+
+    def read(self, value):
+        with urlopen(as_resource(value).build_url(secure=True), timeout=settings.PET_IMAGE_READ_TIMEOUT) as response:
+            return response.read()
+
+    def delete(self, value):
+        uploader.destroy(as_resource(value).public_id)
+
+
+class LocalImageStorage:
+    """
+    Write pet images under `MEDIA_ROOT/pet_images`. A stand-in for
+    Cloudinary in tests and benchmarks; the stored names parse as
+    Cloudinary public ids, so PetImage reads them back unchanged.
+    """
+
+    prefix = 'image/upload/pet_images/'
+
+    def __init__(self, location=None):
+        self.storage = FileSystemStorage(location=location or os.path.join(settings.MEDIA_ROOT, 'pet_images'))
+
+    def name(self, value):
+        return as_resource(value).get_prep_value().removeprefix(self.prefix)
+
+    def save(self, file):
+        return self.prefix + self.storage.save(file.name, file)
+
+    def save_derivative(self, original, suffix, content, extension):
+        # Content-hashed names are immutable, so an existing file is reused.
+        stem = os.path.splitext(self.name(original))[0]
+        name = f'{stem}_{suffix}.{extension}'
+        if not self.storage.exists(name):
+            name = self.storage.save(name, io.BytesIO(content))
+        return self.prefix + name
+
+    def read(self, value):
+        with self.storage.open(self.name(value), 'rb') as file:
+            return file.read()
+
+    def delete(self, value):
+        self.storage.delete(self.name(value))
+
+
+def get_image_storage():
+    return import_string(settings.PET_IMAGE_STORAGE)()
+
+
+def upload_images(files, storage=None, workers=None):
+    """
+    Upload `files` concurrently through a bounded thread pool and return
+    their stored values in the same order. If any upload fails the others
+    are deleted again before the first error is re-raised.
+    """
+    storage = storage or get_image_storage()
+    workers = min(workers or settings.PET_IMAGE_UPLOAD_WORKERS, len(files)) or 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(storage.save, file) for file in files]
+
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        for future in futures:
+            if future.exception() is None:
+                storage.delete(future.result())
+        raise errors[0]
+    return [future.result() for future in futures]
@@ -1,3 +1,1027 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+from api.cache import bump_version
+from order.checkout import checkout_pet
+from order.models import Adopt, AdoptPet
+from pets.models import Category, Pet, PetImage, Review
+from users.ledger import credit
+from users.models import User, Wallet
+from .derivatives import generate_derivatives, schedule_derivatives
+from .holds import release_expired_holds
+from .importers import PetImporter, read_rows
+from .storage import get_image_storage
+
+
+class PetListIndexTests(TestCase):
+    """
+    The common PetViewSet filter combinations must keep using the indexes
+    declared on Pet. Sequential scans are disabled on PostgreSQL so the
+    planner's choice does not depend on the size of the test table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Dog')
+        Pet.objects.bulk_create([
+            Pet(
+                name=f'Pet {i}', category=cls.category, breed='Labrador' if i % 10 == 0 else 'Beagle', age=i % 10,
+                description='A good dog', price=i * 10, is_adopted=i % 3 == 0,
+                availability=Pet.Availability.PUBLIC if i % 2 else Pet.Availability.ANYONE,
+            )
+            for i in range(50)
+        ])
+        cls.user = User.objects.create_user(email='reader@example.com', password='secret')
+
+    def setUp(self):
+        cache.clear()
+
+    def get_plan(self, params, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/pets/', params)
+        self.assertEqual(response.status_code, 200)
+
+        sql = next(query['sql'] for query in queries.captured_queries if 'FROM "pets_pet"' in query['sql'])
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, plan, *names):
+        self.assertTrue(any(name in plan for name in names), f'Expected one of {names} in plan:\n{plan}')
+
+    def test_anonymous_list_uses_availability_index(self):
+        self.assertUsesIndex(self.get_plan({}), 'pet_availability_id_idx')
+
+    def test_anonymous_category_uses_availability_category_index(self):
+        plan = self.get_plan({'category_id': self.category.id})
+        self.assertUsesIndex(plan, 'pet_avail_category_id_idx')
+
+    def test_anonymous_open_category_uses_index(self):
+        plan = self.get_plan({'category_id': self.category.id, 'is_adopted': 'false'})
+        self.assertUsesIndex(plan, 'pet_open_public_cat_idx', 'pet_avail_category_id_idx')
+
+    def test_price_range_ordered_by_price_uses_price_index(self):
+        plan = self.get_plan({'price__gte': 50, 'price__lte': 200, 'ordering': 'price'}, user=self.user)
+        self.assertUsesIndex(plan, 'pet_price_id_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', 'LIKE prefix indexes need varchar_pattern_ops')
+    def test_breed_prefix_uses_pattern_index(self):
+        # Statistics left from earlier tests can make the primary key tie
+        # with the prefix index; plan against this table's rows instead.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE pets_pet')
+        plan = self.get_plan({'breed__startswith': 'Lab'}, user=self.user)
+        self.assertUsesIndex(plan, 'pet_breed_prefix_idx')
+
+
+class PetQueryCountTests(TestCase):
+    """The pets list and detail run a fixed number of queries however many pets, images and reviews there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Dog')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+        cls.reviewers = [User.objects.create_user(email=f'reviewer{i}@example.com', password='secret') for i in range(4)]
+        cls.pet = cls.add_pets(1)[0]
+
+    @classmethod
+    def add_pets(cls, count, images=1, reviews=1):
+        pets = Pet.objects.bulk_create([
+            Pet(name=f'Pet {i}', category=cls.category, breed='Beagle', age=1, description='Friendly', price=10)
+            for i in range(count)
+        ])
+        PetImage.objects.bulk_create([
+            PetImage(pet=pet, image=f'pets/{pet.pk}-{i}.jpg') for pet in pets for i in range(images)
+        ])
+        Review.objects.bulk_create([
+            Review(pet=pet, user=user, rating=4, comment='Nice') for pet in pets for user in cls.reviewers[:reviews]
+        ])
+        return pets
+
+    def client_for(self, user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def assertQueriesDoNotGrow(self, url, expected):
+        for user in (None, self.staff):
+            with self.subTest(user=user):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = self.client_for(user).get(url)
+                self.assertEqual(response.status_code, 200)
+
+        self.add_pets(5, images=3, reviews=4)
+        self.pet.images.create(image='pets/extra.jpg')
+        Review.objects.bulk_create([Review(pet=self.pet, user=user, rating=5, comment='Great') for user in self.reviewers[1:]])
+
+        for user in (None, self.staff):
+            with self.subTest(user=user, grown=True):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = self.client_for(user).get(url)
+                self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_queries_do_not_grow(self):
+        response = self.assertQueriesDoNotGrow('/api/pets/', 3)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(sum(len(pet['reviews']) for pet in response.data['results']), 24)
+
+    def test_detail_queries_do_not_grow(self):
+        response = self.assertQueriesDoNotGrow(f'/api/pets/{self.pet.pk}/', 3)
+        self.assertEqual(len(response.data['images']), 2)
+        self.assertEqual(len(response.data['reviews']), 4)
+
+
+class PetFieldSelectionTests(TestCase):
+    """`?fields=` and `?expand=` trim the rendered pets and what is selected and prefetched for them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(name='Rex', category=category, breed='Beagle', age=2, description='Friendly')
+        cls.pet.images.create(image='pets/rex.jpg')
+        reviewer = User.objects.create_user(email='reviewer@example.com', password='secret')
+        Review.objects.create(pet=cls.pet, user=reviewer, rating=5, comment='Great')
+        Pet.objects.filter(pk=cls.pet.pk).update(review_count=1, rating_sum=5, rating_avg=5, rating_5=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, params, queries):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/pets/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured.captured_queries), queries, [query['sql'] for query in captured.captured_queries])
+        self.sql = captured.captured_queries[0]['sql']
+        return response.data['results'][0]
+
+    def test_default_renders_everything(self):
+        pet = self.get({}, queries=3)
+        self.assertEqual(set(pet), {
+            'id', 'name', 'category', 'breed', 'age', 'price', 'description', 'is_adopted',
+            'images', 'reviews', 'review_count', 'rating_avg', 'rating_histogram',
+        })
+
+    def test_fields_select_only_their_columns(self):
+        pet = self.get({'fields': 'id,name'}, queries=1)
+        self.assertEqual(pet, {'id': self.pet.id, 'name': 'Rex'})
+        self.assertNotIn('"description"', self.sql)
+        self.assertNotIn('"rating_1"', self.sql)
+
+        pet = self.get({'fields': 'name,rating_histogram'}, queries=1)
+        self.assertEqual(pet['rating_histogram'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 1})
+
+    def test_expand_picks_the_prefetches(self):
+        pet = self.get({'expand': 'thumbnail'}, queries=2)
+        self.assertIn('thumbnail', pet)
+        self.assertNotIn('images', pet)
+        self.assertNotIn('reviews', pet)
+
+        pet = self.get({'expand': ''}, queries=1)
+        self.assertFalse({'images', 'reviews', 'thumbnail'} & set(pet))
+
+        pet = self.get({'fields': 'id,reviews'}, queries=2)
+        self.assertEqual(set(pet), {'id', 'reviews'})
+        self.assertEqual(len(pet['reviews']), 1)
+
+    def test_unknown_names_are_ignored(self):
+        pet = self.get({'fields': 'id,nope', 'expand': 'nope'}, queries=1)
+        self.assertEqual(pet, {'id': self.pet.id})
+
+        pet = self.get({'expand': 'nope'}, queries=1)
+        self.assertIn('description', pet)
+        self.assertFalse({'images', 'reviews', 'thumbnail'} & set(pet))
+
+    def test_detail_takes_fields_too(self):
+        response = self.client.get(f'/api/pets/{self.pet.id}/', {'fields': 'name,images'})
+        self.assertEqual(set(response.data), {'name', 'images'})
+
+
+class ReviewEligibilityQueryTests(TestCase):
+    """
+    Creating a review decides eligibility with a single SELECT; duplicate
+    reviews are caught by the unique_together constraint on insert.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Cat')
+        cls.pet = Pet.objects.create(
+            name='Tom', category=category, breed='Siamese', age=2, description='Calm', is_adopted=True,
+        )
+        cls.open_pet = Pet.objects.create(name='Kit', category=category, breed='Siamese', age=1, description='Shy')
+        cls.adopter = User.objects.create_user(email='adopter@example.com', password='secret')
+        cls.other = User.objects.create_user(email='other@example.com', password='secret')
+        adopt = Adopt.objects.create(user=cls.adopter)
+        AdoptPet.objects.create(adopt=adopt, pet=cls.pet)
+
+    def post_review(self, user, pet, rating=4):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(f'/api/pets/{pet.id}/reviews/', {'rating': rating, 'comment': 'Lovely'})
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        return response, selects
+
+    def test_eligible_review_needs_one_select(self):
+        # SELECT eligibility, SAVEPOINT, INSERT review, UPDATE pet aggregates, RELEASE SAVEPOINT.
+        with self.assertNumQueries(5):
+            response, selects = self.post_review(self.adopter, self.pet)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(selects), 1)
+        self.pet.refresh_from_db()
+        self.assertEqual((self.pet.review_count, self.pet.rating_sum), (1, 4))
+
+    def test_duplicate_review_is_rejected_by_constraint(self):
+        self.post_review(self.adopter, self.pet)
+        response, selects = self.post_review(self.adopter, self.pet, rating=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'non_field_errors': ['You have already reviewed this pet.']})
+        self.assertEqual(len(selects), 1)
+        self.pet.refresh_from_db()
+        self.assertEqual((self.pet.review_count, self.pet.rating_sum), (1, 4))
+
+    def test_ineligible_reviews_are_rejected_in_one_query(self):
+        for user, pet, message in [
+            (self.other, self.pet, 'You can only review pets you have adopted.'),
+            (self.adopter, self.open_pet, 'You can only review pets that are adopted.'),
+        ]:
+            with self.assertNumQueries(1):
+                response, _ = self.post_review(user, pet)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {'non_field_errors': [message]})
+
+    def test_author_can_update_review(self):
+        self.post_review(self.adopter, self.pet)
+        review = Review.objects.get(pet=self.pet, user=self.adopter)
+        client = APIClient()
+        client.force_authenticate(self.adopter)
+        response = client.patch(f'/api/pets/{self.pet.id}/reviews/{review.id}/', {'rating': 2})
+        self.assertEqual(response.status_code, 200)
+        self.pet.refresh_from_db()
+        self.assertEqual((self.pet.review_count, self.pet.rating_sum, self.pet.rating_2), (1, 2, 1))
+
+
+class ReviewAggregateTests(TestCase):
+    """Pet rating aggregates follow review writes and can be rebuilt from the reviews."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Cat')
+        cls.pet = Pet.objects.create(
+            name='Tom', category=category, breed='Siamese', age=2, description='Calm', is_adopted=True,
+        )
+        cls.users = [User.objects.create_user(email=f'adopter{i}@example.com', password='secret') for i in range(3)]
+        for user in cls.users:
+            AdoptPet.objects.create(adopt=Adopt.objects.create(user=user), pet=cls.pet)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def review(self, user, rating):
+        response = self.client_for(user).post(f'/api/pets/{self.pet.id}/reviews/', {'rating': rating, 'comment': 'Nice'})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def aggregates(self):
+        return Pet.objects.values(*Pet.AGGREGATE_FIELDS).get(pk=self.pet.pk)
+
+    def assertAggregates(self, histogram):
+        ratings = [rating for rating, count in histogram.items() for _ in range(count)]
+        expected = {
+            'review_count': len(ratings),
+            'rating_sum': sum(ratings),
+            'rating_avg': sum(ratings) / len(ratings) if ratings else 0,
+            **{f'rating_{rating}': histogram.get(rating, 0) for rating in range(1, 6)},
+        }
+        self.assertEqual(self.aggregates(), expected)
+
+    def test_review_writes_move_the_aggregates(self):
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        self.assertAggregates({5: 1, 3: 1})
+
+        url = f'/api/pets/{self.pet.id}/reviews/{first}/'
+        self.assertEqual(self.client_for(self.users[0]).patch(url, {'rating': 1}).status_code, 200)
+        self.assertAggregates({1: 1, 3: 1})
+
+        self.assertEqual(self.client_for(self.users[0]).delete(url).status_code, 204)
+        self.assertAggregates({3: 1})
+
+        self.review(self.users[2], 4)
+        self.users[1].delete()
+        self.assertAggregates({4: 1})
+
+    def test_deleting_the_pet_skips_the_aggregate_update(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.pet.delete()
+        self.assertFalse(Review.objects.exists())
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "pets_pet"')]
+        self.assertEqual(updates, [])
+
+    def test_rebuild_restores_the_aggregates(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 5)
+        self.review(self.users[2], 2)
+        expected = self.aggregates()
+        other = Pet.objects.create(name='Kit', category=self.pet.category, breed='Siamese', age=1, description='Shy')
+        Pet.objects.filter(pk__in=[self.pet.pk, other.pk]).update(review_count=9, rating_sum=1, rating_avg=4.5, rating_5=0)
+
+        stdout = StringIO()
+        call_command('rebuild_pet_ratings', '--batch-size', '1', stdout=stdout)
+        self.assertIn('Rebuilt rating aggregates for 2 pets', stdout.getvalue())
+        self.assertEqual(self.aggregates(), expected)
+        self.assertAggregates({5: 2, 2: 1})
+        self.assertEqual(
+            Pet.objects.values(*Pet.AGGREGATE_FIELDS).get(pk=other.pk),
+            dict.fromkeys(Pet.AGGREGATE_FIELDS, 0),
+        )
+
+
+class CategoryCounterTests(TestCase):
+    """Category pet counters follow pet writes and can be reconciled from the Pet table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dogs = Category.objects.create(name='Dog')
+        cls.cats = Category.objects.create(name='Cat')
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='secret')
+        cls.buyer = User.objects.create_user(email='buyer@example.com', password='secret')
+        credit(cls.buyer.wallet.pk, Decimal('100.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_pet(self, category, **fields):
+        return Pet.objects.create(
+            name='Rex', category=category, breed='Beagle', age=1, description='Friendly', price=Decimal('10.00'),
+            **fields,
+        )
+
+    def assertCounters(self, category, pets, available, public_available):
+        self.assertEqual(
+            Category.objects.values(*Category.COUNTER_FIELDS).get(pk=category.pk),
+            {'pet_count': pets, 'available_pet_count': available, 'public_available_pet_count': public_available},
+        )
+
+    def test_pet_writes_move_the_counters(self):
+        rex = self.create_pet(self.dogs, availability=Pet.Availability.PUBLIC)
+        fido = self.create_pet(self.dogs, availability=Pet.Availability.ANYONE)
+        self.create_pet(self.dogs, is_adopted=True)
+        self.assertCounters(self.dogs, 3, 2, 1)
+
+        response = self.client.patch(f'/api/pets/{rex.id}/', {'category': self.cats.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertCounters(self.dogs, 2, 1, 0)
+        self.assertCounters(self.cats, 1, 1, 1)
+
+        self.assertEqual(self.client.post(f'/api/pets/{rex.id}/adopt/').status_code, 200)
+        self.assertCounters(self.cats, 1, 0, 0)
+
+        checkout_pet(self.buyer, Adopt.objects.create(user=self.buyer).pk, fido.pk)
+        self.assertCounters(self.dogs, 2, 0, 0)
+
+        rex.delete()
+        fido.delete()
+        self.assertCounters(self.cats, 0, 0, 0)
+        self.assertCounters(self.dogs, 1, 0, 0)
+
+    def test_deleting_the_category_skips_the_counter_updates(self):
+        for _ in range(3):
+            self.create_pet(self.dogs)
+        with CaptureQueriesContext(connection) as queries:
+            self.dogs.delete()
+        self.assertFalse(Pet.objects.exists())
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "pets_category"')]
+        self.assertEqual(updates, [])
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.create_pet(self.dogs, availability=Pet.Availability.PUBLIC)
+        self.create_pet(self.dogs, is_adopted=True)
+        Category.objects.filter(pk=self.dogs.pk).update(pet_count=7, available_pet_count=0)
+
+        stdout = StringIO()
+        call_command('reconcile_category_counts', stdout=stdout)
+        self.assertIn('Checked 2 categories, corrected 1', stdout.getvalue())
+        self.assertCounters(self.dogs, 2, 1, 1)
+        self.assertCounters(self.cats, 0, 0, 0)
+
+
+class PetHoldTests(TestCase):
+    """A held pet can only be checked out by its holder until the hold expires."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(
+            name='Rex', category=category, breed='Beagle', age=2, description='Friendly', price=Decimal('100.00'),
+        )
+        cls.holder = User.objects.create_user(email='holder@example.com', password='secret')
+        cls.other = User.objects.create_user(email='other@example.com', password='secret')
+        for user in (cls.holder, cls.other):
+            credit(user.wallet.pk, Decimal('500.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, user, method, path, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return getattr(client, method)(path, data)
+
+    def hold(self, user):
+        return self.request(user, 'post', f'/api/pets/{self.pet.id}/hold/')
+
+    def checkout(self, user, adopt=None):
+        adopt = adopt or Adopt.objects.create(user=user)
+        return self.request(user, 'post', f'/api/adoptions/{adopt.id}/pets/', {'pet_id': self.pet.id})
+
+    def test_hold_is_one_update(self):
+        with self.assertNumQueries(1):
+            response = self.hold(self.holder)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.hold(self.other).status_code, 409)
+
+    def test_only_holder_can_check_out(self):
+        self.hold(self.holder)
+        adopt = Adopt.objects.create(user=self.other)
+        # The adoption's owner and the pets are read; the wallet is never touched.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.checkout(self.other, adopt).status_code, 409)
+
+        self.assertEqual(self.checkout(self.holder).status_code, 201)
+        self.pet.refresh_from_db()
+        self.assertEqual((self.pet.is_adopted, self.pet.held_by_id), (True, None))
+        self.assertEqual(Wallet.objects.get(user=self.other).balance, Decimal('500.00'))
+
+    def test_expired_hold_is_free(self):
+        self.hold(self.holder)
+        Pet.objects.filter(pk=self.pet.pk).update(held_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.hold(self.other).status_code, 200)
+        self.assertEqual(release_expired_holds(), 0)
+        Pet.objects.filter(pk=self.pet.pk).update(held_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_holds(), 1)
+        self.assertEqual(self.checkout(self.holder).status_code, 201)
+
+    def test_release(self):
+        self.hold(self.holder)
+        self.assertEqual(self.request(self.holder, 'delete', f'/api/pets/{self.pet.id}/hold/').status_code, 204)
+        self.assertEqual(self.hold(self.other).status_code, 200)
+
+
+class PetCacheTests(TestCase):
+    """Writes to a pet reach cached lists and conditional retrieves once they commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(name='Rex', category=category, breed='Beagle', age=2, description='Friendly')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def adopt(self):
+        staff = APIClient()
+        staff.force_authenticate(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(staff.patch(f'/api/pets/{self.pet.id}/', {'is_adopted': True}).status_code, 200)
+
+    def test_write_invalidates_cached_list(self):
+        self.client.get('/api/pets/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/pets/')
+        self.assertFalse(response.data['results'][0]['is_adopted'])
+
+        self.adopt()
+        self.assertTrue(self.client.get('/api/pets/').data['results'][0]['is_adopted'])
+
+    def test_write_changes_retrieve_etag(self):
+        url = f'/api/pets/{self.pet.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.adopt()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_adopted'])
+
+
+@override_settings(PET_IMPORT_BATCH_SIZE=2)
+class PetImportTests(TestCase):
+    """Bulk imports insert the valid rows, report the rest and keep the category counters right."""
+
+    header = 'name,category,breed,age,description,price,is_adopted\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dogs = Category.objects.create(name='Dog')
+        cls.cats = Category.objects.create(name='Cat')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, content, name='pets.csv'):
+        upload = SimpleUploadedFile(name, content.encode() if isinstance(content, str) else content)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/pets/import/', {'file': upload})
+
+    def counters(self, category):
+        category.refresh_from_db()
+        return [getattr(category, field) for field in Category.COUNTER_FIELDS]
+
+    def test_upload_imports_valid_rows_and_reports_the_rest(self):
+        response = self.upload(
+            self.header
+            + 'Rex,dog,Beagle,2,Friendly,50,false\n'
+            + 'Tom,Cat,Tabby,1,Calm,20,true\n'
+            + 'Odd,Dog,Pug,old,Loud,10,false\n'
+            + 'Ghost,Bird,Parrot,1,Chatty,5,false\n'
+            + 'Max,Dog,Boxer,3,Playful,,\n'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('age', response.data['errors'][0]['errors'])
+        self.assertEqual(response.data['errors'][1]['errors'], {'category': ['Category does not exist.']})
+
+        self.assertEqual(set(Pet.objects.values_list('name', flat=True)), {'Rex', 'Tom', 'Max'})
+        self.assertEqual(self.counters(self.dogs), [2, 2, 2])
+        self.assertEqual(self.counters(self.cats), [1, 0, 0])
+
+    def test_categories_differing_in_case_need_the_exact_name(self):
+        big_dogs = Category.objects.create(name='DOG')
+        response = self.upload(
+            self.header
+            + 'Rex,Dog,Beagle,2,Friendly,50,false\n'
+            + 'Max,DOG,Mastiff,3,Huge,80,false\n'
+            + 'Odd,dog,Pug,1,Loud,10,false\n'
+            + 'Tom,cat,Tabby,1,Calm,20,false\n'
+        )
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 1))
+        self.assertEqual(response.data['errors'], [
+            {'row': 3, 'errors': {'category': ['Several categories match this name; use its exact spelling.']}},
+        ])
+        self.assertEqual(
+            dict(Pet.objects.values_list('name', 'category__name')),
+            {'Rex': 'Dog', 'Max': 'DOG', 'Tom': 'Cat'},
+        )
+        self.assertEqual(self.counters(big_dogs), [1, 1, 1])
+
+    def test_upload_reads_jsonl(self):
+        response = self.upload(
+            '{"name": "Rex", "category": "Dog", "breed": "Beagle", "age": 2, "description": "Friendly"}\n'
+            '\n[1, 2]\n{broken\n',
+            name='pets.jsonl',
+        )
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+
+    def test_unreadable_file_is_reported_not_raised(self):
+        rows = ''.join(f'Pet {i},Dog,Beagle,1,{"x" * 200},10,false\n' for i in range(100))
+        response = self.upload((self.header + rows).encode() + b'Bad \xff,Dog,Pug,1,Loud,10,false\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.data['created'], 0)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertIn('Could not read the rest of the file', response.data['errors'][0]['errors']['non_field_errors'][0])
+        self.assertEqual(self.counters(self.dogs)[0], response.data['created'])
+
+        response = self.upload(self.header + f'Rex,Dog,Beagle,2,{"x" * 200000},50,false\n')
+        self.assertEqual((response.status_code, response.data['failed']), (200, 1))
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is PostgreSQL only')
+    def test_copy_sets_created_at(self):
+        before = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = PetImporter(use_copy=True).run(
+                read_rows(BytesIO((self.header + 'Rex,Dog,Beagle,2,Friendly,50,false\n').encode()), 'csv')
+            )
+        self.assertEqual(result['created'], 1)
+        self.assertGreaterEqual(Pet.objects.get(name='Rex').created_at, before)
+        self.assertEqual(self.counters(self.dogs), [1, 1, 1])
+
+    def test_upload_is_staff_only(self):
+        self.client.force_authenticate(User.objects.create_user(email='reader@example.com', password='secret'))
+        self.assertEqual(self.upload(self.header).status_code, 403)
+
+    def test_command_imports_and_limits_reported_errors(self):
+        content = self.header + 'Rex,Dog,Beagle,2,Friendly,50,false\n' + 'Bad,Dog,Pug,old,Loud,10,false\n' * 3
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pets.csv')
+            with open(path, 'w') as file:
+                file.write(content)
+            stdout, stderr = StringIO(), StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_pets', path, '--max-errors', '1', stdout=stdout, stderr=stderr)
+
+        self.assertIn('Imported 1 pets, 3 rows failed', stdout.getvalue())
+        self.assertEqual(stderr.getvalue().count('Row '), 1)
+        self.assertIn('... 2 more rows failed', stderr.getvalue())
+        self.assertEqual(self.counters(self.dogs), [1, 1, 1])
+
+
+class PetSearchTests(TestCase):
+    """
+    Full-text search over the PostgreSQL search vector or, locally, the
+    SQLite FTS5 table, both kept up to date by triggers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+
+        def pet(name, breed, description):
+            return Pet.objects.create(name=name, category=category, breed=breed, age=1, description=description)
+
+        cls.mixed = pet('Rex', 'Mixed', 'Part beagle, part terrier')
+        cls.beagle = pet('Max', 'Beagle', 'Calm and quiet')
+        cls.poodle = pet('Bella', 'Poodle', 'Quiet lap dog')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, terms, **params):
+        response = self.client.get('/api/pets/', {'search': terms, **params})
+        self.assertEqual(response.status_code, 200)
+        return [pet['id'] for pet in response.data['results']]
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('quiet calm'), [self.beagle.id])
+        self.assertEqual(self.search('terrier'), [self.mixed.id])
+        self.assertEqual(self.search('siamese'), [])
+
+    def test_best_match_comes_first(self):
+        # The name and breed weigh more than the description.
+        self.assertEqual(self.search('beagle'), [self.beagle.id, self.mixed.id])
+        self.assertEqual(self.search('beagle', ordering='id'), [self.mixed.id, self.beagle.id])
+
+        response = self.client.get('/api/pets/', {'search': 'beagle', 'page_size': 1})
+        self.assertEqual([pet['id'] for pet in response.data['results']], [self.beagle.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([pet['id'] for pet in response.data['results']], [self.mixed.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_index_follows_updates_and_deletes(self):
+        # The triggers are under test here, not the list cache.
+        self.poodle.description = 'Quiet beagle cross'
+        self.poodle.save()
+        cache.clear()
+        self.assertEqual(set(self.search('beagle')), {self.beagle.id, self.mixed.id, self.poodle.id})
+
+        Pet.objects.filter(pk=self.mixed.pk).update(breed='Terrier', description='Wiry')
+        self.beagle.delete()
+        cache.clear()
+        self.assertEqual(self.search('beagle'), [self.poodle.id])
+        self.assertEqual(self.search('wiry'), [self.mixed.id])
+
+
+class PetImageDerivativeTests(TestCase):
+    """Uploaded pet images get content-named thumbnail and medium copies."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(name='Rex', category=category, breed='Beagle', age=2, description='Friendly')
+
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, PET_IMAGE_STORAGE='pets.storage.LocalImageStorage'))
+        self.storage = get_image_storage()
+
+    def upload(self, name, size, mode='RGB'):
+        buffer = BytesIO()
+        PILImage.new(mode, size, 'orange').save(buffer, 'PNG')
+        return self.storage.save(SimpleUploadedFile(name, buffer.getvalue()))
+
+    def open(self, value):
+        return PILImage.open(BytesIO(self.storage.read(value)))
+
+    def test_derivatives_are_sized_and_named_by_content(self):
+        image = PetImage.objects.create(pet=self.pet, image=self.upload('dog.png', (1200, 600)))
+        generate_derivatives(image)
+        image.refresh_from_db()
+
+        self.assertRegex(image.thumbnail, r'^image/upload/pet_images/dog_thumbnail_[0-9a-f]{12}\.webp$')
+        self.assertRegex(image.medium, r'^image/upload/pet_images/dog_medium_[0-9a-f]{12}\.webp$')
+        with self.open(image.thumbnail) as thumbnail, self.open(image.medium) as medium:
+            self.assertEqual((thumbnail.format, thumbnail.size, medium.size), ('WEBP', (320, 160), (960, 480)))
+
+        # The names hash the content, so regenerating reuses the same files.
+        self.assertEqual(generate_derivatives(image), {'thumbnail': image.thumbnail, 'medium': image.medium})
+
+    @override_settings(PET_IMAGE_DERIVATIVE_FORMAT='JPEG')
+    def test_small_images_are_not_enlarged(self):
+        image = PetImage.objects.create(pet=self.pet, image=self.upload('cat.png', (100, 50), mode='RGBA'))
+        values = generate_derivatives(image)
+        self.assertTrue(values['thumbnail'].endswith('.jpg'))
+        with self.open(values['thumbnail']) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.mode, thumbnail.size), ('JPEG', 'RGB', (100, 50)))
+
+    def test_images_left_pending_are_picked_up_by_the_command(self):
+        # The upload only schedules the work; here its background thread
+        # never runs, as on a serverless deployment.
+        with self.captureOnCommitCallbacks():
+            PetImage.objects.create(pet=self.pet, image=self.upload('dog0.png', (400, 400)))
+            images = PetImage.objects.bulk_create([PetImage(pet=self.pet, image=self.upload('dog1.png', (400, 400)))])
+            schedule_derivatives(image.pk for image in images)
+        self.assertEqual(PetImage.objects.filter(thumbnail='').count(), 2)
+
+        stdout = StringIO()
+        call_command('generate_image_derivatives', stdout=stdout)
+        self.assertIn('Generated derivatives for 2 images', stdout.getvalue())
+        self.assertFalse(PetImage.objects.filter(Q(thumbnail='') | Q(medium='')).exists())
+
+
+class StubImageStorage:
+    """
+    An image storage that records what it saves and deletes. A `barrier`
+    holds every save until that many are in flight at once, and names in
+    `fail` raise instead of being saved.
+    """
+
+    saved = []
+    deleted = []
+    fail = set()
+    barrier = None
+
+    def save(self, file):
+        if self.barrier is not None:
+            self.barrier.wait(timeout=5)
+        if file.name in self.fail:
+            raise OSError(f'Upload of {file.name} failed')
+        value = f'image/upload/pet_images/{file.name}'
+        self.saved.append(value)
+        return value
+
+    def delete(self, value):
+        self.deleted.append(value)
+
+
+@override_settings(PET_IMAGE_STORAGE='pets.tests.StubImageStorage', PET_IMAGE_UPLOAD_WORKERS=4)
+class PetImageUploadTests(TestCase):
+    """Several `images` are uploaded concurrently, inserted at once and cleaned up on failure."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(name='Rex', category=category, breed='Beagle', age=2, description='Friendly')
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        StubImageStorage.saved, StubImageStorage.deleted = [], []
+        StubImageStorage.fail, StubImageStorage.barrier = set(), None
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def image(self, name):
+        buffer = BytesIO()
+        PILImage.new('RGB', (10, 10), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def upload(self, *names):
+        return self.client.post(
+            f'/api/pets/{self.pet.id}/images/', {'images': [self.image(name) for name in names]}, format='multipart',
+        )
+
+    def test_images_upload_concurrently_and_insert_at_once(self):
+        # Every save waits until all three are in flight, so serial uploads would time out.
+        StubImageStorage.barrier = threading.Barrier(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload('a.png', 'b.png', 'c.png')
+        self.assertEqual(response.status_code, 201)
+
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "pets_petimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            list(PetImage.objects.filter(pet=self.pet).order_by('id').values_list('id', flat=True)),
+            [image['id'] for image in response.data],
+        )
+        self.assertEqual(
+            [image.image.public_id for image in PetImage.objects.filter(pet=self.pet).order_by('id')],
+            ['pet_images/a', 'pet_images/b', 'pet_images/c'],
+        )
+        self.assertEqual(StubImageStorage.deleted, [])
+
+    def test_failed_upload_deletes_the_others(self):
+        StubImageStorage.barrier = threading.Barrier(3)
+        StubImageStorage.fail = {'b.png'}
+        with self.assertRaises(OSError):
+            self.upload('a.png', 'b.png', 'c.png')
+        self.assertFalse(PetImage.objects.exists())
+        self.assertCountEqual(StubImageStorage.deleted, StubImageStorage.saved)
+        self.assertEqual(len(StubImageStorage.saved), 2)
+
+    def test_failed_insert_deletes_the_uploads(self):
+        with patch.object(PetImage.objects, 'bulk_create', side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                self.upload('a.png', 'b.png')
+        self.assertFalse(PetImage.objects.exists())
+        self.assertCountEqual(StubImageStorage.deleted, StubImageStorage.saved)
+        self.assertEqual(len(StubImageStorage.saved), 2)
+
+
+class PetFacetTests(TestCase):
+    """Facet counts agree with the matching querysets, cost a fixed number of queries and follow writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dogs = Category.objects.create(name='Dog')
+        cls.cats = Category.objects.create(name='Cat')
+        breeds = {cls.dogs: ['Beagle', 'Boxer', 'Pug'], cls.cats: ['Siamese', 'Persian']}
+        for i in range(30):
+            category = cls.dogs if i % 3 else cls.cats
+            Pet.objects.create(
+                name=f'Pet {i}', category=category, breed=breeds[category][i % len(breeds[category])],
+                age=i % 9, description='Friendly', price=i * 25, is_adopted=i % 4 == 0,
+                availability=Pet.Availability.PUBLIC if i % 5 else Pet.Availability.ANYONE,
+            )
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/api/pets/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertFacets(self, facets, pets):
+        self.assertEqual(facets['total'], pets.count())
+        self.assertEqual(
+            {item['name']: item['count'] for item in facets['category']},
+            {category.name: pets.filter(category=category).count() for category in Category.objects.all()
+             if pets.filter(category=category).exists()},
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['breed']},
+            {breed: pets.filter(breed=breed).count() for breed in pets.values_list('breed', flat=True)},
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['is_adopted']},
+            {value: pets.filter(is_adopted=value).count() for value in (True, False)
+             if pets.filter(is_adopted=value).exists()},
+        )
+        price = {item['bucket']: item['count'] for item in facets['price']}
+        self.assertEqual(price['0-50'], pets.filter(price__lt=50).count())
+        self.assertEqual(price['100-250'], pets.filter(price__gte=100, price__lt=250).count())
+        self.assertEqual(price['500+'], pets.filter(price__gte=500).count())
+        age = {item['bucket']: item['count'] for item in facets['age']}
+        self.assertEqual(age['1-3'], pets.filter(age__gte=1, age__lt=3).count())
+        self.assertEqual(age['7+'], pets.filter(age__gte=7).count())
+        self.assertEqual(sum(price.values()), pets.count())
+        self.assertEqual(sum(age.values()), pets.count())
+
+    def test_counts_match_the_filtered_pets(self):
+        facets = self.facets()
+        self.assertNotIn('availability', facets)
+        self.assertFacets(facets, Pet.objects.filter(availability=Pet.Availability.PUBLIC))
+
+        self.client.force_authenticate(self.staff)
+        facets = self.facets()
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['availability']},
+            {value: Pet.objects.filter(availability=value).count() for value in Pet.Availability.values},
+        )
+        self.assertFacets(facets, Pet.objects.all())
+        self.assertFacets(
+            self.facets(category_id=self.dogs.id, price__gte=100, is_adopted='false'),
+            Pet.objects.filter(category=self.dogs, price__gte=100, is_adopted=False),
+        )
+        self.assertFacets(self.facets(search='boxer'), Pet.objects.filter(breed='Boxer'))
+
+    def test_queries_do_not_grow_with_the_catalogue(self):
+        self.client.force_authenticate(self.staff)
+        with self.assertNumQueries(3):
+            self.facets()
+        cache.clear()
+        rabbits = Category.objects.create(name='Rabbit')
+        for i in range(10):
+            Pet.objects.create(
+                name=f'Bun {i}', category=rabbits, breed=f'Lop {i}', age=i, description='Soft', price=i * 70,
+            )
+        with self.assertNumQueries(3):
+            facets = self.facets()
+        self.assertFacets(facets, Pet.objects.all())
+
+    def test_pet_writes_invalidate_cached_facets(self):
+        self.assertFacets(self.facets(), Pet.objects.filter(availability=Pet.Availability.PUBLIC))
+        with self.assertNumQueries(0):
+            self.facets()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pet.objects.create(name='New', category=self.cats, breed='Sphynx', age=1, description='Bald', price=10)
+        facets = self.facets()
+        self.assertIn({'value': 'Sphynx', 'count': 1}, facets['breed'])
+        self.assertFacets(facets, Pet.objects.filter(availability=Pet.Availability.PUBLIC))
+
+
+class ConditionalGetTests(TestCase):
+    """Pet, category and review reads answer 304 until a write to their namespace commits."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Dog')
+        cls.pet = Pet.objects.create(
+            name='Rex', category=cls.category, breed='Beagle', age=2, description='Friendly', is_adopted=True,
+        )
+        cls.adopter = User.objects.create_user(email='adopter@example.com', password='secret')
+        AdoptPet.objects.create(adopt=Adopt.objects.create(user=cls.adopter), pet=cls.pet)
+        Review.objects.create(pet=cls.pet, user=cls.adopter, rating=4, comment='Lovely')
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assertRevalidates(self, url, write):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Authorization', response['Vary'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_pet_list(self):
+        def rename():
+            self.pet.name = 'Max'
+            self.pet.save()
+
+        response = self.assertRevalidates('/api/pets/', rename)
+        self.assertEqual(response.data['results'][0]['name'], 'Max')
+
+    def test_categories_follow_reconciled_counters(self):
+        self.client.force_authenticate(self.staff)
+        Category.objects.filter(pk=self.category.pk).update(pet_count=7)
+        response = self.assertRevalidates(
+            '/api/categories/', lambda: call_command('reconcile_category_counts', stdout=StringIO()),
+        )
+        self.assertEqual(response.data[0]['pet_count'], 1)
+
+    def test_reviews_and_ratings_follow_rebuilds(self):
+        self.assertRevalidates(
+            f'/api/pets/{self.pet.id}/reviews/',
+            lambda: Review.objects.create(pet=self.pet, user=self.staff, rating=2, comment='Loud'),
+        )
+        response = self.assertRevalidates(
+            f'/api/pets/{self.pet.id}/', lambda: call_command('rebuild_pet_ratings', stdout=StringIO()),
+        )
+        self.assertEqual(response.data['review_count'], 2)
+
+    def test_if_modified_since_only_answers_the_same_audience(self):
+        # The modification time is recorded by the first write.
+        bump_version('pets')
+        response = self.client.get('/api/pets/')
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get('/api/pets/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/pets/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
@@ -1,27 +1,44 @@
+from functools import partial
+from django.conf import settings
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAdminUser
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from api.permissions import IsAdminOrReadAndPostOnly
 from .permissions import IsReviewAuthorOrReadOnly
 from rest_framework.decorators import action
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Prefetch
+from django.core.files.uploadedfile import UploadedFile
+from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
+from rest_framework import status
 from .models import Category, Pet, PetImage, Review
-from .serializers import CategorySerializer, PetSerializer, PetImageSerializer, ReviewSerializer
+from .serializers import CategorySerializer, PetSerializer, PetImageSerializer, PetImageUploadSerializer, ReviewSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from .filters import PetFilter
+from .filters import PetFilter, PetSearchFilter
+from .facets import compute_facets
+from .holds import hold_pet, release_pet
+from .importers import IMPORT_FORMATS, PetImporter, guess_format, read_rows
+from .storage import get_image_storage, upload_images
+from .derivatives import schedule_derivatives
+from rest_framework.parsers import MultiPartParser
+from drf_yasg import openapi
+from api.pagination import KeysetPagination
+from api.cache import CachedResponseMixin, ConditionalGetMixin, invalidate
 from drf_yasg.utils import swagger_auto_schema
 
 
 
-class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.annotate(pet_count=Count('pets')).all()
+class CategoryViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
+    cache_namespace = 'categories'
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminUser]
 
     @swagger_auto_schema(
         operation_summary="Retrieve all categories",
-        operation_description="Get a list of all categories with pet count",
+        operation_description="Get a list of all categories with their maintained pet counts",
         responses={200: CategorySerializer(many=True)}
     )
     def list(self, request, *args, **kwargs):
@@ -59,19 +76,54 @@ class CategoryViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class PetViewSet(ModelViewSet):
+class PetViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
+    cache_namespace = 'pets'
     serializer_class = PetSerializer
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
-    search_fields = ['name', 'breed']
+    filter_backends = [DjangoFilterBackend, PetSearchFilter, OrderingFilter]
+    search_fields = ['name', 'breed', 'description']
+    ordering_fields = ['id', 'price', 'age', 'rating_avg']
     filterset_class = PetFilter
+    pagination_class = KeysetPagination
     permission_classes = [IsAdminOrReadAndPostOnly]
 
+    # Pet columns behind serializer fields that are not columns themselves.
+    serializer_columns = {
+        'rating_histogram': ['rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+    }
+
     def get_queryset(self):
         user = self.request.user
+        queryset = self.select_requested_fields(Pet.objects.all())
         if user.is_authenticated:
-            return Pet.objects.prefetch_related('images').all()
+            return queryset.all()
         else:
-            return Pet.objects.prefetch_related('images').filter(availability=Pet.Availability.PUBLIC).all()
+            return queryset.filter(availability=Pet.Availability.PUBLIC).all()
+
+    def select_requested_fields(self, queryset):
+        # Only prefetch and load what the requested fieldset renders, plus the
+        # ordering columns the paginator reads back from each row.
+        wants = partial(self.get_serializer_class().wants_field, self.request)
+
+        if wants('images') or wants('thumbnail'):
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=PetImage.objects.only('id', 'pet_id', 'image', 'thumbnail', 'medium'))
+            )
+        if wants('reviews'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'reviews',
+                    queryset=Review.objects.select_related('user')
+                    .only('id', 'pet_id', 'rating', 'comment', 'user__email')
+                    .order_by('id'),
+                )
+            )
+
+        concrete = {field.name for field in Pet._meta.concrete_fields}
+        columns = set(self.ordering_fields)
+        for name in self.get_serializer_class().Meta.fields:
+            if wants(name):
+                columns.update(column for column in self.serializer_columns.get(name, [name]) if column in concrete)
+        return queryset.only(*columns)
         
     @swagger_auto_schema(
         operation_summary="Retrieve all pets",
@@ -129,16 +181,101 @@ class PetViewSet(ModelViewSet):
         pet.save()
         return Response({'status': 'Pet marked as adopted'})
 
+    @swagger_auto_schema(
+        method="post",
+        operation_summary="Hold a pet",
+        operation_description="Reserve the pet for the authenticated user for a few minutes; until the hold "
+                              "expires nobody else can hold or check it out. Holding again extends the hold",
+        responses={200: "The hold's expiry", 409: "Adopted or held by another user"}
+    )
+    @swagger_auto_schema(
+        method="delete",
+        operation_summary="Release a pet hold",
+        responses={204: "No Content"}
+    )
+    @action(detail=True, methods=['post', 'delete'], permission_classes=[IsAuthenticated])
+    def hold(self, request, pk=None):
+        if not pk.isdigit():
+            raise NotFound("Pet does not exist")
+        if request.method == 'DELETE':
+            release_pet(request.user, pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({'pet_id': int(pk), 'held_until': hold_pet(request.user, pk)})
+
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Facet counts for the pet catalogue",
+        operation_description="Counts by category, breed, adoption status, availability (staff only), "
+                              "price and age bucket for the pets matching the same filters and search as the list",
+        responses={200: "Facet counts"}
+    )
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        return self.cached_response(self.get_facets, request, timeout=settings.FACETS_CACHE_TIMEOUT)
+
+    def get_facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_facets(queryset, include_availability=request.user.is_staff))
+
+    @swagger_auto_schema(
+        method="post",
+        operation_summary="Bulk import pets",
+        operation_description="Admin only. Upload a CSV (with header) or JSONL file of pets; "
+                              "`category` is the category name. Rows are inserted in batches and "
+                              "invalid rows are reported without aborting the file.",
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter('format', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=[*IMPORT_FORMATS]),
+        ],
+        responses={200: "Created and failed row counts with per-row errors"}
+    )
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or guess_format(upload.name)
+        if fmt not in IMPORT_FORMATS:
+            return Response({'format': [f'Must be one of {", ".join(IMPORT_FORMATS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = PetImporter(batch_size=settings.PET_IMPORT_BATCH_SIZE)
+        return Response(importer.run(read_rows(upload.file, fmt)))
+
 
 class PetImageViewSet(ModelViewSet):
     serializer_class = PetImageSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAdminOrReadAndPostOnly]
 
     def get_queryset(self):
         return PetImage.objects.filter(pet_id=self.kwargs.get('pet_pk'))
 
     def perform_create(self, serializer):
-        serializer.save(pet_id=self.kwargs.get('pet_pk'))
+        image = serializer.validated_data['image']
+        if isinstance(image, UploadedFile):
+            image = get_image_storage().save(image)
+        serializer.save(pet_id=self.kwargs.get('pet_pk'), image=image)
+
+    def create_many(self, request):
+        pet = get_object_or_404(Pet, pk=self.kwargs.get('pet_pk'))
+        upload = PetImageUploadSerializer(data=request.data)
+        upload.is_valid(raise_exception=True)
+
+        storage = get_image_storage()
+        values = upload_images(upload.validated_data['images'], storage=storage)
+        try:
+            with transaction.atomic():
+                images = PetImage.objects.bulk_create([PetImage(pet=pet, image=value) for value in values])
+                # bulk_create sends no post_save, see pets.signals.
+                invalidate('pets')
+                schedule_derivatives(image.pk for image in images)
+        except Exception:
+            for value in values:
+                storage.delete(value)
+            raise
+        return Response(PetImageSerializer(images, many=True).data, status=status.HTTP_201_CREATED)
 
     @swagger_auto_schema(
         operation_summary="Retrieve all images for a pet",
@@ -149,16 +286,22 @@ class PetImageViewSet(ModelViewSet):
 
     @swagger_auto_schema(
         operation_summary="Add image to a pet",
+        operation_description="Send one `image`, or several repeated `images` form fields to upload "
+                              "them concurrently and get the list of created images back",
         request_body=PetImageSerializer,
         responses={201: PetImageSerializer}
     )
     def create(self, request, *args, **kwargs):
+        if 'images' in request.FILES:
+            return self.create_many(request)
         return super().create(request, *args, **kwargs)
 
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, ModelViewSet):
+    cache_namespace = 'pets'
     serializer_class = ReviewSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsReviewAuthorOrReadOnly]
 
     def get_queryset(self):
@@ -0,0 +1,84 @@
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.authentication import invalidate_user
+from .models import Wallet, WalletEntry, WalletSnapshot, entries_since_snapshot
+
+
+def _share_wallet(wallet_id):
+    """Return the id of the wallet's owner, locking the wallet on PostgreSQL."""
+    # Entry inserts share a KEY SHARE lock on their wallet, so they never
+    # wait for each other or for a debit, only for take_snapshot(). The
+    # FK check would take the same lock, but only at commit since Django
+    # creates deferred constraints.
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT user_id FROM {Wallet._meta.db_table} WHERE id = %s FOR KEY SHARE', [wallet_id])
+            row = cursor.fetchone()
+        return row and row[0]
+    return Wallet.objects.filter(pk=wallet_id).values_list('user_id', flat=True).first()
+
+
+def credit(wallet_id, amount, kind=WalletEntry.Kind.TOP_UP, adopt_id=None):
+    """Append a credit of `amount` to the wallet's ledger."""
+    with transaction.atomic():
+        user_id = _share_wallet(wallet_id)
+        entry = WalletEntry.objects.create(wallet_id=wallet_id, kind=kind, amount=amount, adopt_id=adopt_id)
+        invalidate_user(user_id)
+        return entry
+
+
+def debit(user, amount, kind=WalletEntry.Kind.ADOPTION, adopt_id=None):
+    """
+    Append a debit of `amount` to `user`'s wallet if its balance covers
+    it, returning whether it did. Must run inside a transaction.
+
+    Debits of one wallet queue on its row lock, so two of them can never
+    both spend the same money. Credits don't take that lock, and a credit
+    still in flight is simply not counted yet.
+    """
+    wallet_id = Wallet.objects.select_for_update(no_key=True).filter(user=user).values_list('id', flat=True).first()
+    if wallet_id is None:
+        return False
+    # Read the balance only once the lock is held: a statement that waited
+    # for the lock still sees the data as of before the wait.
+    balance = Wallet.objects.filter(pk=wallet_id).values_list('current_balance', flat=True).get()
+    if balance < amount:
+        return False
+    WalletEntry.objects.create(wallet_id=wallet_id, kind=kind, amount=-amount, adopt_id=adopt_id)
+    invalidate_user(user.pk)
+    return True
+
+
+def take_snapshot(wallet_id):
+    """
+    Record the wallet's current balance and last entry, so later balance
+    reads only sum the entries after it.
+    """
+    with transaction.atomic():
+        # FOR UPDATE waits for every transaction still holding the wallet's
+        # KEY SHARE lock, so no entry can commit below `last_entry_id`.
+        if Wallet.objects.select_for_update().filter(pk=wallet_id).values_list('id', flat=True).first() is None:
+            return None
+        last_entry = WalletEntry.objects.filter(wallet=OuterRef('pk')).order_by('-id').values('id')[:1]
+        balance, last_entry_id = (
+            Wallet.objects.filter(pk=wallet_id)
+            .annotate(last_entry_id=Subquery(last_entry))
+            .values_list('current_balance', 'last_entry_id')
+            .get()
+        )
+        if last_entry_id is None:
+            return None
+        return WalletSnapshot.objects.create(wallet_id=wallet_id, balance=balance, last_entry_id=last_entry_id)
+
+
+def wallets_due_for_snapshot(min_entries):
+    """Ids of wallets with at least `min_entries` entries since their latest snapshot."""
+    recent = entries_since_snapshot(OuterRef('pk')).annotate(count=Count('id')).values('count')
+    return (
+        Wallet.objects.annotate(recent=Coalesce(Subquery(recent), 0))
+        .filter(recent__gte=min_entries)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
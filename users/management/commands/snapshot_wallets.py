@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.ledger import take_snapshot, wallets_due_for_snapshot
+
+
+class Command(BaseCommand):
+    help = "Snapshot the balance of wallets with many ledger entries since their last snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-entries', type=int, default=settings.WALLET_SNAPSHOT_MIN_ENTRIES)
+
+    def handle(self, *args, **options):
+        taken = 0
+        # One short transaction per wallet keeps each wallet's lock brief.
+        for wallet_id in wallets_due_for_snapshot(options['min_entries']).iterator():
+            if take_snapshot(wallet_id) is not None:
+                taken += 1
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {taken} wallets"))
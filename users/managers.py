@@ -1,6 +1,41 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import transaction
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
 
-class CustomUserManager(BaseUserManager):
+
+class UserQuerySet(QuerySet):
+
+    def update(self, **kwargs):
+        # Updates skip post_save, so drop the cached copies of the users they
+        # change here, see api.authentication. bulk_update() comes through
+        # here too.
+        from api.authentication import invalidate_user
+        with transaction.atomic(using=self.db):
+            user_ids = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            for user_id in user_ids:
+                invalidate_user(user_id)
+        return rows
+
+
+class CustomUserManager(BaseUserManager.from_queryset(UserQuerySet)):
+
+    def with_profile(self):
+        """Users annotated with their `wallet_balance` and `adoption_count`, in the same query."""
+        from order.models import Adopt
+        from .models import wallet_balance
+        adoptions = (
+            Adopt.objects.filter(user=OuterRef('pk'))
+            .order_by()
+            .values('user')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return self.get_queryset().annotate(
+            wallet_balance=wallet_balance(OuterRef('wallet')),
+            adoption_count=Coalesce(Subquery(adoptions), 0),
+        )
 
     def create_user(self, email, password=None, **extra_fields):
         from .models import Wallet
@@ -12,7 +47,7 @@ class CustomUserManager(BaseUserManager):
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
-        Wallet.objects.create(user=user, balance=0.00)
+        Wallet.objects.create(user=user)
         return user
 
 
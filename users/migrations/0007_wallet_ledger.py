@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Each existing balance becomes the wallet's opening entry.
+    Wallet = apps.get_model('users', 'Wallet')
+    WalletEntry = apps.get_model('users', 'WalletEntry')
+    WalletEntry.objects.bulk_create(
+        [
+            WalletEntry(wallet_id=wallet_id, kind='opening', amount=balance)
+            for wallet_id, balance in Wallet.objects.exclude(balance=0).values_list('id', 'balance').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_alter_adoptpet_unique_together_remove_adopt_status_and_more'),
+        ('users', '0006_alter_wallet_user'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='wallet',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.CreateModel(
+            name='WalletEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('top_up', 'Top-up'), ('adoption', 'Adoption'), ('refund', 'Refund')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('adopt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='order.adopt')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='users.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'id'], name='wallet_entry_wallet_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='users.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', '-last_entry_id'], name='wallet_snapshot_latest_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
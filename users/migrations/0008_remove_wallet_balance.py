@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Separate from 0007 so the opening entries' deferred FK checks have
+    # fired before the wallet table is altered.
+
+    dependencies = [
+        ('users', '0007_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='wallet',
+            name='balance',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_remove_wallet_balance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='walletentry',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='users.wallet'),
+        ),
+        migrations.AlterField(
+            model_name='walletsnapshot',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='users.wallet'),
+        ),
+    ]
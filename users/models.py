@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from .managers import CustomUserManager
 
@@ -18,6 +22,93 @@ class User(AbstractUser):
         return self.email
 
 
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def entries_since_snapshot(wallet):
+    """
+    The entries of `wallet` (a wallet id or an OuterRef to one) recorded
+    after its latest snapshot, grouped for aggregating in a subquery.
+    """
+    # Inside the entries query the same reference sits one level deeper.
+    nested = OuterRef(wallet) if isinstance(wallet, OuterRef) else wallet
+    since = WalletSnapshot.objects.filter(wallet=nested).order_by('-last_entry_id').values('last_entry_id')[:1]
+    return (
+        WalletEntry.objects.filter(wallet=wallet, pk__gt=Coalesce(Subquery(since), 0))
+        .order_by()
+        .values('wallet')
+    )
+
+
+def wallet_balance(wallet):
+    """
+    The balance of `wallet`: its latest snapshot plus the sum of the
+    entries after it, as one expression costing two index range scans
+    however long the wallet's history is.
+    """
+    snapshot = WalletSnapshot.objects.filter(wallet=wallet).order_by('-last_entry_id').values('balance')[:1]
+    recent = entries_since_snapshot(wallet).annotate(total=Sum('amount')).values('total')
+    zero = Value(Decimal('0.00'))
+    return (
+        Coalesce(Subquery(snapshot), zero, output_field=MONEY)
+        + Coalesce(Subquery(recent), zero, output_field=MONEY)
+    )
+
+
+class WalletManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().annotate(current_balance=wallet_balance(OuterRef('pk')))
+
+
 class Wallet(models.Model):
+    """
+    A user's wallet. The balance is not stored on the row; it is derived
+    from the append-only WalletEntry ledger (see users.ledger) and
+    annotated on every Wallet query as `current_balance`.
+    """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=00.00)
+
+    objects = WalletManager()
+
+    class Meta:
+        # Also used for `user.wallet`, which then carries the balance too.
+        base_manager_name = 'objects'
+
+    @property
+    def balance(self):
+        if 'current_balance' not in self.__dict__:
+            self.current_balance = Wallet.objects.filter(pk=self.pk).values_list('current_balance', flat=True).get()
+        return self.current_balance
+
+
+class WalletEntry(models.Model):
+    class Kind(models.TextChoices):
+        OPENING = 'opening', 'Opening balance'
+        TOP_UP = 'top_up', 'Top-up'
+        ADOPTION = 'adoption', 'Adoption'
+        REFUND = 'refund', 'Refund'
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='entries')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    # Signed: credits are positive, debits negative.
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    adopt = models.ForeignKey('order.Adopt', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='wallet_entry_wallet_id_idx'),
+        ]
+
+
+class WalletSnapshot(models.Model):
+    """The balance of a wallet over all its entries up to `last_entry_id`."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-last_entry_id'], name='wallet_snapshot_latest_idx'),
+        ]
@@ -1,8 +1,9 @@
+from decimal import Decimal
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer , UserSerializer as BaseUserSerializer
 from rest_framework import serializers
-from .models import Wallet
+from .ledger import credit
+from .models import Wallet, WalletEntry
 from users.models import User
-from order.serializers import AdoptSerializer
 
 
 class WalletSerializer(serializers.ModelSerializer):
@@ -18,24 +19,26 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 
 
 class UserSerializer(BaseUserSerializer):
+    # Both annotated by users.views.UserViewSet; the adoptions themselves
+    # are paginated under /api/adoptions/history/.
     wallet = serializers.DecimalField(
-        source='wallet.balance', max_digits=10, decimal_places=2, read_only=True
-    )
-    adoption_history = AdoptSerializer(
-        source='adoptions', many=True, read_only=True
+        source='wallet_balance', max_digits=12, decimal_places=2, read_only=True
     )
+    adoption_count = serializers.IntegerField(read_only=True)
 
     class Meta(BaseUserSerializer.Meta):
         ref_name = 'CustomUser'
         fields = [
             'id', 'email', 'first_name', 'last_name',
-            'phone_number', 'address', 'wallet', 'adoption_history'
+            'phone_number', 'address', 'wallet', 'adoption_count'
         ]
-        read_only_fields = ['adoption_history', 'wallet']
-    
+        read_only_fields = ['adoption_count', 'wallet']
+
 
 class WalletSerializer(serializers.ModelSerializer):
     email = serializers.CharField(source='user.email', read_only=True)
+    # Written as the amount to top up, read as the ledger balance.
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
 
     class Meta:
         model = Wallet
@@ -44,19 +47,18 @@ class WalletSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['user']
-        amount = validated_data.get('balance', 0)
+        amount = validated_data['balance']
 
         wallet, created = Wallet.objects.get_or_create(user=user)
-
-        wallet.balance += amount
-        wallet.save()
-        return wallet
+        credit(wallet.pk, amount)
+        return Wallet.objects.get(pk=wallet.pk)
 
 
 
 class WalletAdminSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(write_only=True)
     email = serializers.CharField(source='user.email', read_only=True)
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
 
     class Meta:
         model = Wallet
@@ -72,7 +74,13 @@ class WalletAdminSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("User does not exist")
 
         wallet, created = Wallet.objects.get_or_create(user=user)
-        wallet.balance += amount
-        wallet.save()
-        return wallet
+        credit(wallet.pk, amount)
+        return Wallet.objects.get(pk=wallet.pk)
+
+
+class WalletEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WalletEntry
+        fields = ['id', 'kind', 'amount', 'adopt', 'created_at']
+        read_only_fields = fields
 
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.authentication import invalidate_user
+from order.models import Adopt
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+# The adoption count on a cached user; wallet balances are handled by
+# users.ledger.
+@receiver(post_save, sender=Adopt)
+@receiver(post_delete, sender=Adopt)
+def invalidate_adopter(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
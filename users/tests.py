@@ -1,3 +1,285 @@
-from django.test import TestCase
+import json
+import threading
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from api.authentication import user_cache_key
+from api.idempotency import LOCK_KEY, idempotency_cache_key
+from order.checkout import checkout_pet
+from order.models import Adopt
+from pets.models import Category, Pet
+from .ledger import credit, debit, take_snapshot
+from .models import User, Wallet, WalletEntry, WalletSnapshot
+
+
+class CurrentUserTests(TestCase):
+    """`me` is read in one query however many adoptions the user has."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='adopter@example.com', password='secret')
+        credit(cls.user.wallet.pk, Decimal('500.00'))
+        category = Category.objects.create(name='Dog')
+        for i in range(3):
+            pet = Pet.objects.create(
+                name=f'Pup {i}', category=category, breed='Beagle', age=1, description='Friendly', price=Decimal('50.00'),
+            )
+            checkout_pet(cls.user, Adopt.objects.create(user=cls.user).pk, pet.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_me_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/users/me/')
+        self.assertEqual(response.data['wallet'], Decimal('350.00'))
+        self.assertEqual(response.data['adoption_count'], 3)
+        self.assertNotIn('adoption_history', response.data)
+
+    def test_history_is_paginated(self):
+        response = self.client.get('/api/adoptions/history/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+
+class WalletLedgerTests(TestCase):
+    """The balance is the ledger's sum whether or not snapshots have been taken."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='saver@example.com', password='secret')
+        self.wallet = self.user.wallet
+
+    def assertBalance(self, expected):
+        total = WalletEntry.objects.filter(wallet=self.wallet).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(total, expected)
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, expected)
+        self.assertEqual(User.objects.with_profile().get(pk=self.user.pk).wallet_balance, expected)
+
+    def test_credit_debit_and_snapshot_agree(self):
+        credit(self.wallet.pk, Decimal('100.00'))
+        with transaction.atomic():
+            self.assertTrue(debit(self.user, Decimal('30.00')))
+            self.assertFalse(debit(self.user, Decimal('70.01')))
+        self.assertBalance(Decimal('70.00'))
+
+        self.assertEqual(take_snapshot(self.wallet.pk).balance, Decimal('70.00'))
+        self.assertBalance(Decimal('70.00'))
+
+        credit(self.wallet.pk, Decimal('5.00'))
+        with transaction.atomic():
+            self.assertTrue(debit(self.user, Decimal('10.00')))
+        self.assertBalance(Decimal('65.00'))
+
+        take_snapshot(self.wallet.pk)
+        self.assertEqual(WalletSnapshot.objects.filter(wallet=self.wallet).count(), 2)
+        self.assertBalance(Decimal('65.00'))
+
+    def test_wallets_with_history_are_kept(self):
+        credit(self.wallet.pk, Decimal('10.00'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.delete(f'/api/wallet/{self.wallet.pk}/').status_code, 405)
+
+        response = client.delete('/api/auth/users/me/', {'current_password': 'secret'})
+        self.assertEqual(response.status_code, 409)
+        self.assertBalance(Decimal('10.00'))
+
+    def test_admin_history_of_unknown_wallet_is_not_found(self):
+        credit(self.wallet.pk, Decimal('10.00'))
+        admin = User.objects.create_superuser(email='admin@example.com', password='secret')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(f'/api/admin/wallet/{self.wallet.pk}/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['amount'] for entry in response.data['results']], [Decimal('10.00')])
+
+        for pk in ('abc', self.wallet.pk + 1000):
+            self.assertEqual(client.get(f'/api/admin/wallet/{pk}/history/').status_code, 404)
+
+    def test_admin_export_streams_balances(self):
+        credit(self.wallet.pk, Decimal('12.50'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/admin/wallet/export/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_superuser(email='admin@example.com', password='secret'))
+        response = client.get('/api/admin/wallet/export/', {'export_format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = {row['wallet_id']: row for row in map(json.loads, b''.join(response.streaming_content).decode().splitlines())}
+        row = rows[self.wallet.pk]
+        self.assertEqual((row['user_id'], row['user_email']), (self.user.pk, 'saver@example.com'))
+        self.assertEqual(Decimal(row['balance']), Decimal('12.50'))
+
+
+class IdempotentTopUpTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='payer@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def top_up(self, key):
+        return self.client.post('/api/wallet/', {'balance': '25.00'}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeat_is_replayed_without_queries(self):
+        first = self.top_up('top-up-1')
+        with self.assertNumQueries(0):
+            repeat = self.top_up('top-up-1')
+
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat.data, first.data)
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('25.00'))
+
+    def test_key_reused_with_another_body_is_refused(self):
+        self.top_up('top-up-1')
+        response = self.client.post('/api/wallet/', {'balance': '30.00'}, HTTP_IDEMPOTENCY_KEY='top-up-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('25.00'))
+
+    def test_repeat_in_another_encoding_is_replayed(self):
+        self.top_up('top-up-1')
+        repeat = self.client.post('/api/wallet/', {'balance': '25.00'}, format='json', HTTP_IDEMPOTENCY_KEY='top-up-1')
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+
+    def test_expired_lock_is_not_released_by_its_old_holder(self):
+        digest = idempotency_cache_key(SimpleNamespace(user=self.user, method='POST', path='/api/wallet/'), 'top-up-1')
+        lock_key = LOCK_KEY.format(digest)
+        real_add = cache.add
+
+        def add(key, value, timeout):
+            taken = real_add(key, value, timeout)
+            # The lock expires mid-request and another request takes it.
+            cache.set(lock_key, 'other-holder')
+            return taken
+
+        with patch.object(cache, 'add', add):
+            self.top_up('top-up-1')
+        self.assertEqual(cache.get(lock_key), 'other-holder')
+
+    def test_new_key_runs_again(self):
+        self.top_up('top-up-1')
+        self.top_up('top-up-2')
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('50.00'))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs row-level concurrency from a real database server')
+class ConcurrentTopUpTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_repeats_credit_once(self):
+        user = User.objects.create_user(email='payer@example.com', password='secret')
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def top_up():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post('/api/wallet/', {'balance': '25.00'}, HTTP_IDEMPOTENCY_KEY='top-up-1')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=top_up) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(statuses, [201] * self.threads)
+        self.assertEqual(Wallet.objects.get(user=user).balance, Decimal('25.00'))
+
+
+class CachedAuthenticationTests(TestCase):
+    """JWT requests reuse the cached user until it changes, but check its status on every request."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='reader@example.com', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def me(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/api/auth/users/me/')
+
+    def test_me_needs_no_queries_once_cached(self):
+        with self.assertNumQueries(1):
+            self.me()
+        with self.assertNumQueries(0):
+            response = self.me()
+        self.assertEqual(response.data['wallet'], Decimal('0.00'))
+
+    def test_password_hash_is_not_cached(self):
+        self.me()
+        entry = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', entry['fields'])
+        self.assertNotIn(self.user.password, repr(entry))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/users/set_password/', {
+                'current_password': 'secret', 'new_password': 'N3w-passw0rd!', 're_new_password': 'N3w-passw0rd!',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('N3w-passw0rd!'))
+
+    def test_changed_password_revokes_tokens(self):
+        with patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.me().status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('changed')
+                self.user.save()
+            self.assertEqual(self.me().status_code, 401)
+
+    def test_changes_to_the_user_reach_the_cache(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            credit(self.user.wallet.pk, Decimal('40.00'))
+            Adopt.objects.create(user=self.user)
+        response = self.me()
+        self.assertEqual((response.data['wallet'], response.data['adoption_count']), (Decimal('40.00'), 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            debit(self.user, Decimal('15.00'))
+        self.assertEqual(self.me().data['wallet'], Decimal('25.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_queryset_updates_apply_at_once(self):
+        self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_updates_work_on_a_fresh_row(self):
+        self.me()
+        # A write the cache never hears about.
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {User._meta.db_table} SET first_name = %s WHERE id = %s', ['Stale', self.user.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/auth/users/me/', {'last_name': 'Reader'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            User.objects.values_list('first_name', 'last_name').get(pk=self.user.pk), ('Stale', 'Reader'),
+        )
@@ -1,12 +1,54 @@
+from django.db.models import ProtectedError
+from djoser.views import UserViewSet as BaseUserViewSet
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import Wallet
-from .serializers import WalletSerializer, WalletAdminSerializer
+from api.exceptions import Conflict
+from api.exports import EXPORT_FORMAT_PARAM, EXPORT_FORMATS, export_response, get_export_format
+from api.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from api.pagination import KeysetPagination
+from .models import User, Wallet, WalletEntry
+from .serializers import WalletSerializer, WalletAdminSerializer, WalletEntrySerializer
 
 
-class WalletViewSet(viewsets.ModelViewSet):
+class UserViewSet(BaseUserViewSet):
+    """
+    djoser's user endpoints, with the wallet balance and adoption count
+    annotated so a profile is one query. Reading `me` is usually served
+    from the user api.authentication.CachedJWTAuthentication already
+    loaded; updating or deleting it always works on a fresh row.
+    """
+    queryset = User.objects.with_profile()
+
+    def get_instance(self):
+        user = self.request.user
+        if self.request.method == 'GET' and hasattr(user, 'wallet_balance') and hasattr(user, 'adoption_count'):
+            return user
+        return self.get_queryset().get(pk=user.pk)
+
+    def perform_destroy(self, instance):
+        try:
+            super().perform_destroy(instance)
+        except ProtectedError:
+            raise Conflict("Users with wallet history cannot be deleted; deactivate them instead")
+
+
+class WalletHistoryPagination(KeysetPagination):
+    ordering = '-id'
+
+
+class WalletHistoryMixin:
+    def history_response(self, entries):
+        page = self.paginate_queryset(entries)
+        return self.get_paginated_response(WalletEntrySerializer(page, many=True).data)
+
+
+class WalletViewSet(WalletHistoryMixin, viewsets.ModelViewSet):
+    # The balance only changes through ledger entries, see users.ledger,
+    # and a wallet with entries is never deleted.
+    http_method_names = ['get', 'post', 'head', 'options']
     serializer_class = WalletSerializer
     permission_classes = [IsAuthenticated]
 
@@ -30,10 +72,12 @@ class WalletViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(
         operation_summary="Create Wallet",
-        operation_description="Create a new wallet for the authenticated user",
+        operation_description="Top up the authenticated user's wallet by `balance`, creating it if needed",
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
         request_body=WalletSerializer,
         responses={201: WalletSerializer}
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
@@ -46,28 +90,29 @@ class WalletViewSet(viewsets.ModelViewSet):
         return super().retrieve(request, *args, **kwargs)
 
     @swagger_auto_schema(
-        operation_summary="Update Wallet",
-        operation_description="Update a wallet of the authenticated user",
-        request_body=WalletSerializer,
-        responses={200: WalletSerializer}
+        method="get",
+        operation_summary="Wallet History",
+        operation_description="Top-ups, adoption payments and refunds of the authenticated user's wallet, newest first",
+        responses={200: WalletEntrySerializer(many=True)}
     )
-    def update(self, request, *args, **kwargs):
-        return super().update(request, *args, **kwargs)
-
-    @swagger_auto_schema(
-        operation_summary="Delete Wallet",
-        operation_description="Delete a wallet of the authenticated user",
-        responses={204: 'No Content'}
-    )
-    def destroy(self, request, *args, **kwargs):
-        return super().destroy(request, *args, **kwargs)
+    @action(detail=False, methods=['get'], pagination_class=WalletHistoryPagination)
+    def history(self, request):
+        return self.history_response(WalletEntry.objects.filter(wallet__user=request.user))
 
 
-class WalletAdminViewSet(viewsets.ModelViewSet):
+class WalletAdminViewSet(WalletHistoryMixin, viewsets.ModelViewSet):
+    http_method_names = ['get', 'post', 'head', 'options']
     queryset = Wallet.objects.all()
     serializer_class = WalletAdminSerializer
     permission_classes = [IsAdminUser]
 
+    export_columns = (
+        ('wallet_id', 'id'),
+        ('user_id', 'user_id'),
+        ('user_email', 'user__email'),
+        ('balance', 'current_balance'),
+    )
+
     @swagger_auto_schema(
         operation_summary="Admin: List all Wallets",
         responses={200: WalletAdminSerializer(many=True)}
@@ -82,3 +127,28 @@ class WalletAdminViewSet(viewsets.ModelViewSet):
     )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Admin: Export Wallet balances",
+        operation_description="Stream every wallet with its user's email and balance as CSV or NDJSON",
+        manual_parameters=[
+            openapi.Parameter(EXPORT_FORMAT_PARAM, openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[*EXPORT_FORMATS]),
+        ],
+        responses={200: "CSV or NDJSON file"}
+    )
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        fmt = get_export_format(request)
+        wallets = self.filter_queryset(self.get_queryset()).order_by('id')
+        return export_response(wallets, self.export_columns, 'wallets', fmt)
+
+    @swagger_auto_schema(
+        method="get",
+        operation_summary="Admin: Wallet History",
+        responses={200: WalletEntrySerializer(many=True)}
+    )
+    @action(detail=True, methods=['get'], pagination_class=WalletHistoryPagination)
+    def history(self, request, pk=None):
+        wallet = self.get_object()
+        return self.history_response(WalletEntry.objects.filter(wallet=wallet))